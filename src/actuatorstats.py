@@ -19,6 +19,11 @@ class ActuatorStats:
         cls.stats.setdefault( key, 0 )
         cls.stats[key] += 1
 
+    @classmethod
+    def add( cls, key, value ):
+        cls.stats.setdefault( key, 0 )
+        cls.stats[key] += value
+
     @classmethod 
     def get( cls ):
         # get statistics
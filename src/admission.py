@@ -0,0 +1,65 @@
+# Copyright (c) 2026 Hermann von Borries
+# MIT license
+
+# Admission control of web requests while a tune is playing.
+# Each route is classified as cheap, medium or heavy:
+#   cheap: runs immediately, for example /get_progress, static files
+#       and the buttons of the play page.
+#   medium and heavy: wait for a gap between MIDI events using
+#       scheduler.RequestSlice. The time requested is the measured
+#       average service time of the route, see metrics.py.
+# When no tune is playing, all requests run immediately.
+# Routes not classified are medium.
+from micropython import const
+from time import ticks_ms, ticks_diff
+
+import scheduler
+import metrics
+
+CHEAP = const(0)
+MEDIUM = const(1)
+HEAVY = const(2)
+
+# For medium and heavy routes: estimated service time until
+# it is measured, and maximum time to wait for a gap, msec.
+# If the wait is exceeded, the request runs anyway.
+_ESTIMATE = ( 0, 20, 100 )
+_WAIT_AT_MOST = ( 0, 1_000, 10_000 )
+
+# key=url pattern of the route, value=CHEAP/MEDIUM/HEAVY
+_classes = {}
+
+# Requests waiting for admission
+queue_depth = 0
+max_queue_depth = 0
+
+def classify( route_class, url_patterns ):
+    for url_pattern in url_patterns:
+        _classes[url_pattern] = route_class
+
+async def admit( request ):
+    # Called before the route handler runs
+    global queue_depth, max_queue_depth
+    route = request.url_pattern
+    route_class = _classes.get( route, MEDIUM )
+    if route_class == CHEAP or not scheduler.is_player_active():
+        return
+    requested = metrics.average( route )
+    if requested is None:
+        requested = _ESTIMATE[route_class]
+    t0 = ticks_ms()
+    queue_depth += 1
+    max_queue_depth = max( max_queue_depth, queue_depth )
+    try:
+        async with scheduler.RequestSlice( route, requested + 1,
+                                          _WAIT_AT_MOST[route_class] ):
+            pass
+    except RuntimeError:
+        # No gap long enough, don't keep the browser waiting more
+        pass
+    finally:
+        queue_depth -= 1
+    metrics.add_wait( route, ticks_diff( ticks_ms(), t0 ) )
+
+def get_queue_info():
+    return f"{queue_depth} (max {max_queue_depth})"
@@ -12,6 +12,7 @@ from minilog import getLogger
 from drehorgel import config, led, crank, timezone, controller
 import scheduler
 import fileops
+import progresscache
 from driver_base import BasePin
 
 # >>> evaluate value of battery monitor
@@ -108,6 +109,7 @@ class Battery:
         self.battery_info["remaining_seconds"] = self.estimate_operating_seconds_remaining()
         self.battery_info["low"] = self.estimate_low()
         self.last_update = now
+        progresscache.mark_dirty()
 
     def get_info(self)->dict:
         return self.battery_info
@@ -158,6 +160,7 @@ class Battery:
                 os.remove(config.BATTERY_CALIBRATION_JSON)
             except OSError:
                 pass
+            fileops.invalidate(config.BATTERY_CALIBRATION_JSON)
             return
         level = int(level)
         if level < 0 or level > 100:
@@ -51,12 +51,14 @@ class Config:
         self.DRUMDEF_JSON = "data/drumdef.json"
         self.HISTORY_JSON = "data/history.json"
         self.LYRICS_JSON = "data/lyrics.json"
+        self.LYRICS_FOLDER = "data/lyrics/"
         self.ORGANTUNER_JSON = "data/organtuner.json"
         self.PINOUT_TXT = "data/pinout.txt"
         self.PINOUT_FOLDER = "data"
         self.SETLIST_TITLES_JSON = "data/setlist_titles.json"
         self.SYNC_TUNELIB = "data/sync_tunelib.json"
         self.TUNELIB_JSON = "data/tunelib.json"
+        self.TUNELIB_JSON_GZ = "data/tunelib.json.gz"
         
         # Lower letter config attributes can be changed with config.json/config.html
         # Set default values and data types. 
@@ -91,6 +93,7 @@ class Config:
 
         # Webserver parameters
         self.max_age = 1800
+        self.download_buffer_size = 8192
 
         # Microphone and tuner
         self.mic_test_mode = False
@@ -241,6 +244,9 @@ class Config:
                 self._validate_password( v )
             elif k == "name":
                 self._validate_hostname( v )
+            elif k == "download_buffer_size":
+                if not 1024 <= v <= 32768:
+                    raise ValueError
             return v
         except ValueError:
             raise ValueError( f"Error: [{k}]={v} is not {datatype}" )
@@ -0,0 +1,172 @@
+# Copyright (c) 2026 Hermann von Borries
+# MIT license
+
+# Directory index for the file manager.
+# Listing a folder with dates needs an os.stat() for each file,
+# 100 files take about 4 seconds. The folders whose content only
+# changes through filemanager.py and the tunelib sync (the tunelib
+# and the /software folders) are kept in RAM with name, size
+# and date of each file. Upload, delete and rename update the
+# index, so a tunelib with 1500 MIDI files is listed without
+# reading the folder again.
+# Other folders, such as /data, are written all the time by the
+# software, these are read again for each listing.
+from micropython import const
+import os
+
+import fileops
+
+# Index entry, a list
+_NAME = const(0)
+_IS_DIRECTORY = const(1)
+_SIZE = const(2)
+_DATE = const(3)
+
+# Maximum os.stat() for file dates in one listing, if not,
+# response time becomes slow. Dates not read yet are
+# read in the next listings.
+_MAX_STAT = const(100)
+# Number of folders kept in RAM
+_MAX_FOLDERS = const(3)
+
+# Folders (and their subfolders) kept in RAM
+_managed = ()
+# key=folder, value=function that returns a dict filename:date,
+# to get dates without os.stat()
+_date_sources = {}
+# key=folder, value=dict with key=filename, value=index entry
+_folders = {}
+# Folders in _folders, least recently used first
+_lru = []
+
+def _folder_key( path ):
+    # All folders are absolute paths ending in "/"
+    if not path.startswith("/"):
+        path = "/" + path
+    if not path.endswith("/"):
+        path += "/"
+    return path
+
+def _split( path ):
+    # "/tunelib/abc.mid" -> ("/tunelib/", "abc.mid")
+    path = _folder_key( path )[:-1]
+    p = path.rfind("/")
+    return path[0:p+1], path[p+1:]
+
+def set_managed_folders( folders ):
+    global _managed
+    _managed = tuple( _folder_key( f ) for f in folders )
+    invalidate()
+
+def set_date_source( folder, date_source ):
+    _date_sources[_folder_key( folder )] = date_source
+
+def invalidate( folder=None ):
+    if folder is None:
+        _folders.clear()
+        _lru.clear()
+        return
+    folder = _folder_key( folder )
+    if folder in _folders:
+        del _folders[folder]
+        _lru.remove( folder )
+
+def file_changed( path ):
+    # Called after a file or folder has been written, renamed or
+    # created. Only one os.stat(), the date is read when listing.
+    folder, name = _split( path )
+    index = _folders.get( folder )
+    if index is None:
+        return
+    try:
+        stat = os.stat( folder + name )
+    except OSError:
+        index.pop( name, None )
+        return
+    index[name] = [ name, 1 if stat[0] == 16384 else 0, stat[6], None ]
+
+def file_removed( path ):
+    folder, name = _split( path )
+    index = _folders.get( folder )
+    if index is not None:
+        index.pop( name, None )
+
+def set_dates( folder, dates ):
+    # dates: iterable of (filename, date), for example,
+    # from tunelib.json. Only used if the folder is in RAM.
+    index = _folders.get( _folder_key( folder ) )
+    if index is None:
+        return
+    for name, date in dates:
+        entry = index.get( name )
+        if entry is not None:
+            entry[_DATE] = date
+
+def _build( folder ):
+    try:
+        if not fileops.is_folder( folder ):
+            return {}
+    except OSError:
+        return {}
+    date_source = _date_sources.get( folder )
+    dates = date_source() if date_source else {}
+    index = {}
+    # 16384 means "folder" or "directory", 32768 means file
+    # /rom returns ('rom', 16384, 0), without size,
+    # whereas other folders return ('data', 16384, 0, 0)
+    for dir_entry in os.ilistdir( folder ):
+        name = dir_entry[0]
+        index[name] = [ name,
+                        1 if dir_entry[1] == 16384 else 0,
+                        dir_entry[3] if len(dir_entry) > 3 else 0,
+                        dates.get( name ) ]
+    return index
+
+def _get_index( folder ):
+    index = _folders.get( folder )
+    if index is not None:
+        _lru.remove( folder )
+        _lru.append( folder )
+        return index
+    index = _build( folder )
+    if any( folder.startswith( f ) for f in _managed ):
+        _folders[folder] = index
+        _lru.append( folder )
+        if len(_lru) > _MAX_FOLDERS:
+            del _folders[_lru.pop(0)]
+    return index
+
+def _fill_dates( folder, entries, max_stat ):
+    n = 0
+    for entry in entries:
+        if entry[_DATE] is None:
+            if max_stat is not None and n >= max_stat:
+                return
+            try:
+                entry[_DATE] = fileops.get_file_date( folder + entry[_NAME] )
+            except OSError:
+                entry[_DATE] = ""
+            n += 1
+
+def listdir( path, sort="name", reverse=False, start=0, count=None ):
+    # Returns the number of entries in the folder and a
+    # list with the entries from start to start+count,
+    # folders first, sorted by "name", "size" or "date".
+    folder = _folder_key( path )
+    entries = list( _get_index( folder ).values() )
+    column = { "name": _NAME, "size": _SIZE, "date": _DATE }[sort]
+    if column == _DATE:
+        # All dates are needed to sort
+        _fill_dates( folder, entries, None )
+    entries.sort( key=lambda entry: entry[column], reverse=reverse )
+    entries = ( [ e for e in entries if e[_IS_DIRECTORY] ]
+              + [ e for e in entries if not e[_IS_DIRECTORY] ] )
+    page = entries[start:] if count is None else entries[start:start+count]
+    _fill_dates( folder, page, _MAX_STAT )
+    return len(entries), [ {
+        "name": entry[_NAME],
+        "isDirectory": entry[_IS_DIRECTORY],
+        "size": entry[_SIZE],
+        "path": folder + entry[_NAME],
+        "date": entry[_DATE] or ""
+        } for entry in page ]
@@ -2,8 +2,8 @@
 # MIT license
 #  
 from time import ticks_ms, ticks_diff, ticks_us
-import asyncio
 from actuatorstats import ActuatorStats
+import timerwheel
 
 class BaseDriver:
 
@@ -47,10 +47,8 @@ class BasePin:
     # or Virtual FTOM pin (subclass VirtualDrumPin)
     # in turn subclass SolePin or RCServoPin
 
-    # BasePin._active_pins is a ordered list (oldest first)
-    # of pins that are currently on. 
-    # Used by subclass SolePin to calculate polyphony and
-    # by driver_ftoms to see which pins are already on.
+    # Subclass SolePin keeps the solenoid pins that are currently on
+    # in a linked list (oldest first) to manage polyphony.
     
     # Memory usage 400 bytes per pin all included (dictionaries
     # or lists conaining pins, keys, etc)
@@ -66,18 +64,6 @@ class BasePin:
     # maximum moving servos exceeded. None = no blinking.
     led = None
 
-    @classmethod
-    def set_pinlist( cls, pin_list ):
-        # ActuatorBank sets the complete pin list here, 
-        # used in get_active() below.
-        BasePin.pin_list = pin_list
-    
-
-    @classmethod
-    def get_active( cls ):
-        # Get generator over all active pins (of any kind, RC servo, sole, midi, etc except Null)
-        return ( pin for pin in BasePin.pin_list if pin._current_value )
-
     @classmethod
     def set_led( cls, led ):
         # Inject led object, used by ActuatorBank, is changed
@@ -203,9 +189,25 @@ class SolePin(BasePin):
 
     # Management of maximum solenoids that can be on
     sole_polyphony = 0 
+    # Solenoids held on by simulated drum notes, see driver_ftoms.py.
+    # These count against config_max_polyphony too.
+    drum_polyphony = 0
     # Configuration parameter for polyphony
     config_max_polyphony = 10
 
+    # Doubly linked list of the solenoid pins that are on, oldest
+    # first. The links are stored in the pins themselves, so finding
+    # the oldest pin, adding and removing a pin are O(1) and don't allocate.
+    _lru_head = None
+    _lru_tail = None
+
+    def __init__( self, *args ):
+        super().__init__( *args )
+        self._lru_prev = None
+        self._lru_next = None
+        # True while a simulated drum note holds this pin on
+        self.drum_held = False
+
     @classmethod
     def set_config( cls, config ) :
         # Set by ActuatorBank for all SolePin pins.
@@ -216,6 +218,9 @@ class SolePin(BasePin):
     def clear_active( cls ):
         # When doing all notes off, reset
         SolePin.sole_polyphony = 0
+        # All notes off should have emptied the list, but make sure.
+        while SolePin._lru_head is not None:
+            SolePin._lru_head._lru_remove()
         
     def _compute_battery_time( self ):
         BasePin._battery_consumption += ticks_diff(ticks_ms(), self._transition_time)     
@@ -224,28 +229,62 @@ class SolePin(BasePin):
     # There is a different code for RC servos.
     def _actuator_change( self, new_value ):
         if new_value:
-            while SolePin.sole_polyphony >= SolePin.config_max_polyphony:
+            while ( SolePin.sole_polyphony + SolePin.drum_polyphony 
+                    >= SolePin.config_max_polyphony ):
                 ActuatorStats.count( "exceeded polyphony" )
-                try:
-                    # Find oldest active solenoid pin
-                    oldest_pin = min( pin for pin in BasePin.get_active() if pin.is_solepin )
-                    oldest_pin.force_off()
-                except ValueError:
+                # Turn off oldest active solenoid pin, this removes
+                # it from the list.
+                oldest_pin = SolePin._lru_head
+                if oldest_pin is None:
                     # No active pins, but then, why is SolePin.sole_polyphony != 0?
                     SolePin.sole_polyphony = 0
+                    if SolePin.drum_polyphony >= SolePin.config_max_polyphony:
+                        # Drum notes take all the power, note on lost.
+                        # The drum notes end soon.
+                        return False
                     break
+                oldest_pin.force_off()
             SolePin.sole_polyphony += 1
+            self._lru_append()
         else:
             SolePin.sole_polyphony -= 1
+            self._lru_remove()
         ActuatorStats.max( "max polyphony", SolePin.sole_polyphony )
          # Any polyphony problem has been taken care of, now turn on current note
         return True
-    
-    def __lt__( self, other ):
-        # pin1 < pin2 iff pin1 moved before pin2
-        # For use only over BasePin.get_active() iterator
-        # with the min() funcion to find the oldest active pin
-        return ticks_diff( self._transition_time,  other._transition_time ) < 0 
+
+    def is_on( self ):
+        # True if the solenoid is on, O(1)
+        return self._lru_prev is not None or SolePin._lru_head is self
+
+    def _lru_append( self ):
+        # Add this pin as newest pin that is on
+        tail = SolePin._lru_tail
+        self._lru_prev = tail
+        self._lru_next = None
+        if tail is not None:
+            tail._lru_next = self
+        else:
+            SolePin._lru_head = self
+        SolePin._lru_tail = self
+
+    def _lru_remove( self ):
+        # Remove this pin from the list of pins that are on
+        prev = self._lru_prev
+        nxt = self._lru_next
+        if prev is not None:
+            prev._lru_next = nxt
+        elif SolePin._lru_head is self:
+            SolePin._lru_head = nxt
+        else:
+            # Not in list
+            return
+        if nxt is not None:
+            nxt._lru_prev = prev
+        else:
+            SolePin._lru_tail = prev
+        self._lru_prev = None
+        self._lru_next = None
 
 class RCServoPin(BasePin):
     # Abstract class to derive RC Servo classes GPIOServoPin and PCA9685ServoPin
@@ -276,6 +315,9 @@ class RCServoPin(BasePin):
         # move all servos to the off position and
         # then (if so configured turn off PWM 
         self._count = 1
+        # Bound methods allocated once, for timerwheel.schedule()
+        self._movement_end_cb = self._movement_end
+        self._off_cb = self.off
 
     def _movement_start( self ):
         # A servo movement is about to start
@@ -285,18 +327,12 @@ class RCServoPin(BasePin):
             # to include case of very close movements
             RCServoPin._global_moving += 1
         self._this_moving += 1
-        # Launch task to time when movement has finished
-        asyncio.create_task( self._wait_movement_end() )
-
-    async def _wait_movement_end( self ):
-        # Wait for servo movement to finish.
+        # Have the timer wheel tell when movement has finished.
+        # This does not create a task nor allocate memory for each movement.
+        timerwheel.schedule( self.config_rc_moving_time, self._movement_end_cb )
 
-        # self._wait_movement_end() will take about 1% of the CPU
-        # Having a unique background job for all pins will also take about 1% of CPU
-        # but this design distributes the time in very small tasks 
-        # which is even nicer for asyncio
-
-        await asyncio.sleep_ms( self.config_rc_moving_time )
+    def _movement_end( self ):
+        # Called by the timer wheel when the servo movement has finished.
         # self._this_moving should never go below zero, since +1 and -1 are always paired by this code here.
         self._this_moving -= 1
         if self._this_moving == 0:
@@ -340,17 +376,16 @@ class RCServoPin(BasePin):
             # For on: suppress movement
             # for off: delay movement (and suppress current movement)
             if not new_value:
-                asyncio.create_task( self._delayed_off( self.config_rc_moving_time ))
+                ActuatorStats.count( "rc delayed off" )
+                # Using pin.off() will enable check _actuator_change again after this delay.
+                # That means that a note_off could be delayed several times.
+                # off() can schedule again, must not be called now if the wheel is full
+                if not timerwheel.schedule( self.config_rc_moving_time, self._off_cb, False ):
+                    # No room left to delay, better move now than leave the note on
+                    return True
             # Return False means "supress movement"
             return False
         return True
-    
-    async def _delayed_off( self, t ):
-        # Delay RC servo off movement by about t milliseconds, used by self._actuator_change()
-        await asyncio.sleep_ms( t )
-        # Using pin.off() will enable check _actuator_change again after this delay.
-        # That means that a note_off could be delayed several times.
-        self.off()
 
 # Exception processing pinout file for line ['midi', 7, '', 79, '17 G violin G5', ''] Pulse width must be between 1000 and 2000
 # Traceback (most recent call last):
@@ -1,13 +1,12 @@
 # Copyright (c) 2023-2025 Hermann von Borries
 # MIT license
 
-from time import sleep_ms
-
 import fileops
 from drehorgel import config
 import midi
 from driver_base import BaseDriver, BasePin, SolePin
 from actuatorstats import ActuatorStats
+import timerwheel
 
 # Does not need to be declared singleton. Since __repr__ is
 # defined in BaseDriver, it is unique.
@@ -52,9 +51,24 @@ class FauxTomDriver(BaseDriver):
 # Virtual drum pin, virtual because it's not a hardware pin
 # and pin because it must have the BasePin interface
 class VirtualDrumPin(BasePin):
+    # SolePin.drum_polyphony counts the solenoids currently on
+    # because of drum notes, pin.drum_held marks them.
+
     # Must have same interface as driver pins (except __init__)
     def __init__( self, driver, midi_number, dditem ):
         super().__init__( driver, midi_number, "Simulated drum", midi.NoteDef( midi.DRUM_PROGRAM, midi_number ) )
+        # Pins of the cluster turned on by the drum note that is
+        # sounding now. Lists are reused for each drum note.
+        self._fired = []
+        self._strong_fired = []
+        # Bound methods allocated once, for timerwheel.schedule()
+        self._release_cb = self._release
+        self._release_strong_cb = self._release_strong
+        # Releases scheduled in the timer wheel and not done yet.
+        # Only the last one releases the valves, the others belong
+        # to a drum note that was retriggered.
+        self._pending = 0
+        self._strong_pending = 0
         self.set_virtual_drum_characteristics( dditem )
         
     def set_virtual_drum_characteristics(self, dditem ):
@@ -69,65 +83,100 @@ class VirtualDrumPin(BasePin):
         # Calculate additional time for "stronger" notes in microseconds
         self.strong_added_time = max(0, dditem["strong_duration"] -  dditem["duration"])
         
-        self.midi_virtual_pins = set() # of virtual_pins
-        self.strong_midi_virtual_pins = set()
-        for ddname, pinset in (("midi_list", self.midi_virtual_pins), ("strong_midis", self.strong_midi_virtual_pins) ):
+        self.midi_virtual_pins = [] # of virtual_pins
+        self.strong_midi_virtual_pins = []
+        for ddname, pinlist in (("midi_list", self.midi_virtual_pins), ("strong_midis", self.strong_midi_virtual_pins) ):
             for midi_number in dditem[ddname]:
                 pin = self._driver.actuator_bank.get_pin_by_midi_number( midi_number )
-                if pin and pin.is_solepin:
-                    pinset.add( pin )
+                if pin and pin.is_solepin and pin not in pinlist:
+                    pinlist.append( pin )
 
-        
-
-    # Important restriction: cannot play two drum notes simultaneusly
-    # They will play one after the other
     def on( self ):
-        # Simulate a drum note without disturbing other notes that are be on
-        # actuators_that_are_on() returns a list, must change to set.
-        actuators_on = set(BasePin.get_active())
-        virtual_pins = self.midi_virtual_pins - actuators_on
-        strong_virtual_pins = self.strong_midi_virtual_pins - actuators_on
+        # Simulate a drum note without disturbing other notes that are on.
+        # The valves of the cluster are turned on here and turned off
+        # later by the timer wheel, so other notes are not delayed.
+        if self._fired or self._strong_fired:
+            # Same drum still sounding, release the valves now
+            # and strike again.
+            ActuatorStats.count( "ftom retrigger" )
+            self._release_list( self._fired )
+            self._release_list( self._strong_fired )
+
+        # Find the pins of the cluster that are not sounding already,
+        # once per drum note, without allocating.
+        strong_fired = self._strong_fired
+        for pin in self.strong_midi_virtual_pins:
+            if not pin.is_on() and not pin.drum_held:
+                strong_fired.append( pin )
+
         # Use .low_level_on() and .low_level_off() it is faster but it does
-        # not check polyphony.
+        # not check polyphony.
         # Since driver_base._actuator_change() is NOT called below,
         # check here for polyphony. Instead of turning off old notes, steal
         # notes from the drum cluster.
-        # Don't bother to update SolePin.sole_polyphony here, when
-        # leaving this function, the drum note will be already turned off.
-        allowed =  SolePin.config_max_polyphony - SolePin.sole_polyphony - len(strong_virtual_pins)
+        allowed = ( SolePin.config_max_polyphony - SolePin.sole_polyphony 
+                   - SolePin.drum_polyphony - len(strong_fired) )
         if allowed <= 0:
             # Not enough power. It's not nice to turn off regular notes
             ActuatorStats.count( "ftom skipped")
+            strong_fired.clear()
             return
-        while len(virtual_pins) >= allowed:
-            virtual_pins.pop()
+        fired = self._fired
+        for pin in self.midi_virtual_pins:
+            if len(fired) >= allowed - 1:
+                break
+            if not pin.is_on() and not pin.drum_held:
+                fired.append( pin )
         
         # Sound all notes in the cluster
-        for virtual_pin in strong_virtual_pins:
-            virtual_pin.low_level_on()
-        for virtual_pin in virtual_pins:
-            virtual_pin.low_level_on()
-        # Wait time is short (duration should be <= 50 milliseconds)
-        # Don't use asyncio.sleep_ms because time will be not
-        # controllable and the time is really too short to do other stuff
-        # while waiting.
+        for pin in strong_fired:
+            pin.low_level_on()
+            pin.drum_held = True
+        for pin in fired:
+            pin.low_level_on()
+            pin.drum_held = True
+        SolePin.drum_polyphony += len(fired) + len(strong_fired)
+
         # Duration of the drum note is the highest priority here.
-        sleep_ms( self.duration )
-        # Now turn off what has been turned on
-        for virtual_pin in virtual_pins:
-            virtual_pin.low_level_off()
-        # Wait a bit to turn of stronger (accented) notes
-        sleep_ms( self.strong_added_time )
-        for virtual_pin in strong_virtual_pins:
-            virtual_pin.low_level_off()
+        # The player polls the timer wheel while waiting for the next
+        # MIDI event, so the duration is precise.
+        if fired:
+            self._pending += 1
+            timerwheel.schedule( self.duration, self._release_cb )
+        if strong_fired:
+            # Wait a bit more to turn off stronger (accented) notes
+            self._strong_pending += 1
+            timerwheel.schedule( self.duration + self.strong_added_time, self._release_strong_cb )
         BasePin._battery_consumption += (
-            self.duration*len(virtual_pins) +
-            (self.duration+self.strong_added_time)*len(strong_virtual_pins)
+            self.duration*len(fired) +
+            (self.duration+self.strong_added_time)*len(strong_fired)
             )
 
+    def _release( self ):
+        # Called by timer wheel when duration has elapsed
+        self._pending -= 1
+        if self._pending == 0:
+            self._release_list( self._fired )
+
+    def _release_strong( self ):
+        # Called by timer wheel when duration plus added strong time has elapsed
+        self._strong_pending -= 1
+        if self._strong_pending == 0:
+            self._release_list( self._strong_fired )
+
+    def _release_list( self, pinlist ):
+        for pin in pinlist:
+            pin.drum_held = False
+            # A regular note may have been turned on meanwhile
+            # on this pin. If so, leave it on.
+            if not pin.is_on():
+                pin.low_level_off()
+        SolePin.drum_polyphony -= len(pinlist)
+        pinlist.clear()
+
     def off( self ):
-        # Drum note has already been turned off in on() function
+        # Drum note is turned off by the timer wheel after it's duration
         return
     
     def __repr__( self ):
-        return f"{self.drum_name}.{self.nominal_midi_number}"
\ No newline at end of file
+        return f"{self.drum_name}.{self.nominal_midi_number}"
@@ -2,14 +2,25 @@
 # MIT license
 
 # Controller for MIDI output over serial
+from micropython import const
 from machine import UART
 
 from driver_base import SolePin, BaseDriver
 from umidiparser import SYSEX, ESCAPE
+from actuatorstats import ActuatorStats
+import timerwheel
 
-# >>> Add support for MIDI over USB?
+# >>> Add support for MIDI over USB?
 
-BYTEBUFFER = bytearray(1)
+# Size of the output buffer. A group of simultaneous events
+# seldom needs more than 30 bytes.
+_BUFFER_SIZE = const(256)
+# Time to send one byte at 31250 baud, 10 bits per byte
+_USEC_PER_BYTE = const(320)
+
+# All sound off (120) and all notes off (123) on all channels,
+# using running status within each channel.
+_ALL_NOTES_OFF = bytes( b for channel in range(16) for b in (0xB0+channel, 120, 0, 123, 0) )
 
 # Not a singleton, there could be different serial
 # drivers, each for a uart/pin/channel combination
@@ -29,29 +40,81 @@ class MIDISerialDriver(BaseDriver):
         # assert 1 <= uart <= 2
         # assert 0 <= channel <= 15
         self._uart = UART( uart_number, baudrate=31250, tx=txpin, rx=rxpin )
-        # Have bytearray with the MIDI event ready, format is:
-        # event+channel, note number, velocity
-        self._note_on = bytearray( (0x90 + channel, 0, 127))
-        self._note_off = bytearray((0x80 + channel, 0,   0))
+        # Note on and note off are both sent as note on, note off
+        # with velocity 0, so that running status applies to all notes.
+        self._note_status = 0x90 + channel
+
+        # Messages of a group of simultaneous events are collected
+        # in self._buffer and sent with one uart.write() by flush().
+        # The player calls flush() before waiting for the next
+        # group of events. For notes that are not sent by the player,
+        # the timer wheel calls flush().
+        self._buffer = bytearray( _BUFFER_SIZE )
+        self._buffer_mv = memoryview( self._buffer )
+        self._length = 0
+        # Status byte of the last channel message in the buffer, for running
+        # status. Each write starts with a full status byte, so a receiver
+        # that lost track recovers quickly.
+        self._running_status = 0
+        self._flush_cb = self.flush
  
     def _note_on_message( self, midi_number ):
-        # Since the uart buffer is fairly large (256 bytes) and
-        # very unlikely to fill up, uart.write() should never block. 
-        # To fill that, more 1000 messages must be sent in 1 second.
-        # So there is little need to handle that case.
-        self._note_on[1] = midi_number
-        self.write( self._note_on )
+        self._add_channel_message( self._note_status, midi_number, 127 )
 
     def _note_off_message( self, midi_number ):
-        self._note_off[1] = midi_number
-        self.write( self._note_off )
+        self._add_channel_message( self._note_status, midi_number, 0 )
+
+    def _add_channel_message( self, status, data1, data2 ):
+        # Add a three byte channel message to the buffer
+        if self._length > _BUFFER_SIZE - 3:
+            self.flush()
+        if not self._length:
+            timerwheel.schedule( 0, self._flush_cb )
+        buffer = self._buffer
+        n = self._length
+        if status != self._running_status:
+            buffer[n] = status
+            n += 1
+            self._running_status = status
+        else:
+            ActuatorStats.add( "midi running status saved", 1 )
+        buffer[n] = data1
+        buffer[n+1] = data2
+        self._length = n + 2
 
     def write( self, message ):
+        # Add any message to the buffer.
+        # Message must start with a status byte.
+        length = len(message)
+        if length > _BUFFER_SIZE:
+            # Too long for the buffer, send now
+            self.flush()
+            self._send( message, length )
+            return
+        if self._length + length > _BUFFER_SIZE:
+            self.flush()
+        if not self._length:
+            timerwheel.schedule( 0, self._flush_cb )
+        n = self._length
+        self._buffer_mv[n:n+length] = message
+        self._length = n + length
+        self._running_status = 0
+
+    def flush( self ):
+        # Send the buffer contents with one uart.write()
+        if self._length:
+            # Since the uart buffer is fairly large (256 bytes) and
+            # very unlikely to fill up, uart.write() should never block. 
+            # To fill that, more 1000 messages must be sent in 1 second.
+            # So there is little need to handle that case.
+            self._send( self._buffer_mv[0:self._length], self._length )
+            self._length = 0
+            self._running_status = 0
+
+    def _send( self, message, length ):
         self._uart.write( message )
-
-    def writebyte( self, one_byte ):
-        BYTEBUFFER[0] = one_byte
-        self.write( BYTEBUFFER )
+        ActuatorStats.add( "midi serial bytes", length )
+        ActuatorStats.max( "max midi serial write msec", (length*_USEC_PER_BYTE+999)//1000 )
 
     def all_notes_off( self ):
         # Turn all notes off by sending a control message.
@@ -64,27 +127,41 @@ class MIDISerialDriver(BaseDriver):
         # 121 Reset All Controllers, resets all instrument controllers to default value (including volume)
         # 123 All Notes Off, releases all voices
         # For good measure send all notes off on all channels
-        for value in (120,123):
-            for channel in range(16):
-                self._uart.write( bytes( (0xB0+channel, value, 0) ) )
+        # Discard pending messages, there is no use sending them now.
+        self._length = 0
+        self._running_status = 0
+        self._uart.write( _ALL_NOTES_OFF )
         # In case the receiver does not understand this message,
         # actuator_bank.all_notes_off() will also force each note off
-        # individually.
+        # individually.
 
     def define_pin( self, *args):
         return VirtualMIDIPin( self, *args )
 
     def passthrough( self, midi_event ):
         # Pass through does not do polyphony checking nor battery tally
-        status = midi_event.status
+        # The event data is copied as is to the buffer.
         if midi_event.is_channel(): 
             # Channel events: note on, note off, control change, program change etc
-            self.writebyte(status + midi_event.channel)
-            self.write( midi_event.data )
-        elif status == SYSEX:
-            self.writebyte( SYSEX )
-            self.write( midi_event.data )
-            self.writebyte( ESCAPE )
+            data = midi_event.data
+            length = len(data)
+            if self._length > _BUFFER_SIZE - 1 - length:
+                self.flush()
+            if not self._length:
+                timerwheel.schedule( 0, self._flush_cb )
+            n = self._length
+            status = midi_event.status + midi_event.channel
+            if status != self._running_status:
+                self._buffer[n] = status
+                n += 1
+                self._running_status = status
+            else:
+                ActuatorStats.add( "midi running status saved", 1 )
+            self._buffer_mv[n:n+length] = data
+            self._length = n + length
+        elif midi_event.status == SYSEX:
+            # A sysex event ends running status, write() takes care of that.
+            self.write( bytes((SYSEX,)) + midi_event.data + bytes((ESCAPE,)) )
         # Meta events are ignored. They are for MIDI files only.
 
 class VirtualMIDIPin(SolePin):
@@ -1,13 +1,22 @@
 # (c) Copyright 2025-2026 Hermann Paul von Borries
 # MIT License
+from micropython import const
 import os
 from microdot import send_file
 
 from drehorgel import tunemanager, config, timezone
 import fileops
+import scheduler
+import staticindex
+import dirindex
 
 # Compress midi, html, css and js files in the browser: NO, bad idea.
 
+# Uploads are written to flash in chunks of this size
+_UPLOAD_CHUNK = const(4096)
+# Number of files being written by upload() and upload_batch()
+_uploads_running = 0
+
 DESTINATION_FOLDERS = {
     "mid": config.TUNELIB_FOLDER,
     "main.py": "/", # special case
@@ -24,6 +33,12 @@ DESTINATION_FOLDERS = {
     "jpg": "/software/static/",
 }
 
+# The content of these folders only changes through this module
+# and the tunelib sync, keep their listing in RAM.
+dirindex.set_managed_folders( ( config.TUNELIB_FOLDER, "/software/" ) )
+# Dates of the MIDI files are already in tunelib.json.
+dirindex.set_date_source( config.TUNELIB_FOLDER, tunemanager.file_date_dict )
+
 def _check_midi_file( path, file_size=-1 ):
     # Check if file operation affected a MIDI file.
     # If so, queue a file update or deletion in tunemanager.
@@ -38,67 +53,96 @@ def _check_midi_file( path, file_size=-1 ):
     if "tunelib" in path:
         # Abort sync to avoid duplicate work for tunlib.json and for /tunelib/*-mid
         tunemanager.abort_sync()
-        
+    _check_tunelib_json( path )
 
-def listdir(path):
-    if not path.endswith("/"):
-        path += "/"
-    listing = fast_listdir(path)
-    tunelibfd = dict() # tunelibfd only available for files in /tunelib folder
-    if path == "/tunelib/":
-        # Speed up /tunelib folder, dates are already in tunelib.json.
-        tunelibfd = tunemanager.file_date_dict()
-
-    getdate = 0
-    for fileinfo in listing:
-        # Add date from tunelib.json if available.
-        date = tunelibfd.get(fileinfo["name"], "") 
-        # Show date for up to 100 files, if not, response
-        # time becomes slow.
-        # This maximum does not apply to tunelib.
-        # 100 files can take about 4 seconds due to os.stat()
-        if not date and getdate<100:
-            date = fileops.get_file_date(path + fileinfo["name"])
-            getdate += 1
-        fileinfo["date"] = date
-    del tunelibfd
-    return listing
-
-def fast_listdir(path):
-    if not fileops.is_folder( path ):
-        return []
-    # 16384 means "folder" or "directory"
-    # 32768 means file
-    # /rom returns ('rom', 16384, 0)
-    # whereas other notes return   ('data', 16384, 0, 0)
-
-    def get_size( dir_entry ):
-        try:
-            return dir_entry[3]  # size in bytes
-        except IndexError:
-            # This happens for /rom, which has no size
-            return 0
+def _check_tunelib_json( path ):
+    # tunelib.json uploaded or deleted, the browsers must read it again
+    if path.lstrip("/") == config.TUNELIB_JSON:
+        tunemanager.tunelib_json_replaced()
         
-    return [{
-              "name":dir_entry[0], 
-              "isDirectory":1 if dir_entry[1]==16384 else 0, 
-              "size": get_size( dir_entry), 
-              "path":path+dir_entry[0],
-              "date":"" # date has to be added later
-              } for dir_entry in os.ilistdir(path)]
-        
-def upload( filedata, path, filename, mtime, size  ):
+def _check_midi_files( uploaded ):
+    # Same as _check_midi_file() for a list of (path, file_size)
+    # of a batch upload, the MIDI files are queued all at once.
+    midi_files = [ (path, file_size) for path, file_size in uploaded 
+                   if "tunelib/" in path and fileops.get_file_type( path ) == "mid" ]
+    if midi_files:
+        tunemanager.queue_files_updated( midi_files )
+    if any( "tunelib" in path for path, _ in uploaded ):
+        tunemanager.abort_sync()
+    for path, _ in uploaded:
+        _check_tunelib_json( path )
+
+
+def listdir( path, sort="name", reverse=False, start=0, count=None ):
+    # Returns number of entries in folder and the list of
+    # entries from start to start+count. See dirindex.py
+    return dirindex.listdir( path, sort, reverse, start, count )
+
+async def upload( stream, content_length, path, filename, mtime, size  ):
     # Upload a file from the PC to the microcontroller
+    #   stream: request.stream, the file is read in chunks
+    #          and never held in RAM as a whole.
+    #   content_length: bytes to read from stream
     #   mtime: file modification date of origin file on PC in
     #          Unix fashion, i.e. seconds since 1/1/1970.
     #   size: file size of origin file on PC. >>> should check?
     # Check flash full, send message to javascript client.
-    if is_flash_full():
+    if is_flash_full( content_length ):
         raise RuntimeError("Flash full, can't upload")
-
+    folder = _destination_folder( path, filename )
+    result = await _store( stream, content_length, folder, filename, mtime )
+    _check_midi_file( folder + filename, result["newFileSize"] )
+    return result
+
+async def upload_batch( stream, content_length, path ):
+    # Upload many files in one request. The request body
+    # is a tar archive made by filemanager.html, with mtime
+    # and size of each file in the tar header.
+    # path: destination folder or "__auto__", as for upload()
+    # Returns a list with the result of each file.
+    # MIDI files are queued for the tunelib sync all at once.
+    if is_flash_full( content_length ):
+        raise RuntimeError("Flash full, can't upload")
+    results = []
+    uploaded = []
+    try:
+        while True:
+            header = await stream.readexactly( 512 )
+            # End of archive is marked with a block of zeros
+            if len(header) < 512 or header[0] == 0:
+                break
+            filename = _tar_field( header, 0, 100 )
+            size = int( _tar_field( header, 124, 12 ) or "0", 8 )
+            mtime = int( _tar_field( header, 136, 12 ) or "0", 8 )
+            # File data is padded to a multiple of 512 bytes
+            padding = -size % 512
+            try:
+                # Only plain file names, the folder is given by path
+                if "/" in filename or ".." in filename:
+                    raise ValueError(f"Invalid file name {filename}")
+                folder = _destination_folder( path, filename )
+            except (RuntimeError, ValueError) as e:
+                await _skip_stream( stream, size + padding )
+                results.append( {"name": filename, "error": True, "alert": str(e) } )
+                continue
+            result = await _store( stream, size, folder, filename, mtime )
+            await _skip_stream( stream, padding )
+            result["name"] = filename
+            results.append( result )
+            uploaded.append( ( folder + filename, size ) )
+    finally:
+        # Files stored before an error must get to the tunelib sync
+        _check_midi_files( uploaded )
+    return results
+
+def _tar_field( header, start, length ):
+    return header[start:start+length].split(b"\0")[0].decode().strip()
+
+def _destination_folder( path, filename ):
+    # Check filename and return the folder where to store the file
     # Javascript must use String.normalize("NFC") for filenames
     # See filemanager.html encodePath()
-    # If not normalized, "Hände" can be encoded either:
+    # If not normalized, "Hände" can be encoded either:
     # "H\xc3\xa4nde "(this is desirable, Code point for a umlaut, chr(0xe0)
     # "Ha\xcc\x88nde" (this is not desirable, combined a + diacritics mark)
     # Here \xcc\x88 = U+308 = "\u0308" is the diacritics mark, 
@@ -136,22 +180,47 @@ def upload( filedata, path, filename, mtime, size  ):
         # folders be supported?
         fileops.make_folder( "/software" )
     fileops.make_folder( folder )   
+    dirindex.file_changed( folder )
+    return folder
 
+def is_uploading():
+    # The tunelib sync slows down while files are uploaded
+    return _uploads_running > 0
 
+async def _store( stream, size, folder, filename, mtime ):
+    global _uploads_running
+    _uploads_running += 1
+    try:
+        return await _store_file( stream, size, folder, filename, mtime )
+    finally:
+        _uploads_running -= 1
+
+async def _store_file( stream, size, folder, filename, mtime ):
+    # Store the next size bytes of stream as folder+filename
     path = folder + filename
    
     try:
         old_file_size = os.stat(path)[6]
     except OSError:
         old_file_size = None
-    
-    # Create file with time set to the mtime of the input file
-    with timezone.set_time( mtime ):
-        with open(path, "wb") as file:  # type:ignore
-            new_file_size = len(filedata)
-            file.write( filedata )
 
-    _check_midi_file( path, new_file_size )
+    # Write to a temporary file and rename when complete, an
+    # interrupted upload does not leave a truncated file.
+    temp_path = path + ".tmp"
+    try:
+        new_file_size = await _write_stream( stream, size, temp_path, mtime )
+        try:
+            os.rename( temp_path, path )
+        except OSError:
+            # Some file systems don't replace an existing file
+            os.remove( path )
+            os.rename( temp_path, path )
+    except:
+        try:
+            os.remove( temp_path )
+        except OSError:
+            pass
+        raise
 
     # If a compressed file is replaced with a uncompressed one
     # delete the replaced file. Same with .py and .mpy
@@ -162,29 +231,63 @@ def upload( filedata, path, filename, mtime, size  ):
     if fileops.file_exists( equiv ):
         # The equiv file is replaced by the new file
         os.remove( equiv )
+        dirindex.file_removed( equiv )
+        fileops.invalidate( equiv )
+    fileops.invalidate( path )
+    staticindex.invalidate( path )
+    dirindex.file_changed( path )
         
     return {"folder": folder, 
             "oldFileSize": old_file_size,
             "newFileSize": new_file_size }
 
-def download(path):
-    # Download a file from the microcontroller to the PC
-    # Serve file in chunks of 10kB
-    def serve_file( path ):
-        buffer = bytearray(10000)
-        mvb = memoryview(buffer)
-        with open(path, "rb") as file:
-            while True:
-                length = file.readinto(buffer)
-                if not length:
-                    break
-                yield mvb[0:length]
-
+async def _skip_stream( stream, n ):
+    while n > 0:
+        data = await stream.read( min( n, _UPLOAD_CHUNK ) )
+        if not data:
+            raise OSError("Upload incomplete")
+        n -= len(data)
+
+async def _write_stream( stream, content_length, path, mtime ):
+    # Copy content_length bytes from stream to file through a
+    # buffer. Writing to flash is done in time slices
+    # of the player, receiving data from the network is not.
+    # Each upload has it's own buffer, uploads may run concurrently.
+    buffer = memoryview( bytearray( _UPLOAD_CHUNK ) )
+    # Create file with time set to the mtime of the input file.
+    # The file system takes the mtime when the file is opened, so the
+    # time is changed only for open() and not while receiving data.
+    with timezone.set_time( mtime ):
+        file = open(path, "wb")
+    with file:
+        written = 0
+        while written < content_length:
+            n = min( content_length - written, _UPLOAD_CHUNK )
+            if hasattr( stream, "readinto" ):
+                n = await stream.readinto( buffer[0:n] )
+                data = buffer[0:n]
+            else:
+                data = await stream.read( n )
+                n = len(data)
+            if not n:
+                raise OSError("Upload incomplete")
+            async with scheduler.RequestSlice( "upload", 50, 10_000 ):
+                file.write( data )
+            written += n
+    return written
+
+def download( path, request ):
+    # Download a file from the microcontroller to the PC.
+    # send_file() honors Range requests, so the browser can resume
+    # an interrupted download. The file is sent in chunks of
+    # config.download_buffer_size bytes, the buffer is allocated
+    # once per download.
     filename = fileops.get_basename(path)
-    
-    return serve_file(path), 200, {
-        "Content-Type": "application/octet-stream",
-        "Content-Disposition": f'attachment; filename="{filename}"'}
+    response = send_file( path, content_type="application/octet-stream",
+                          request=request )
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response.send_file_buffer_size = config.download_buffer_size
+    return response
 
 
 
@@ -279,16 +382,19 @@ def status():
         'used_flash': stat[0]*(stat[2]-stat[3])
     }
 
-def is_flash_full():
+def is_flash_full( file_size=0 ):
     fstat = status()
     # Leave at least 200 kb of flash free when uploading a file.
     # If not, json files or error.log files cannot be written 
     # and that is kind of fatal...
-    return fstat["total_flash"]-fstat["used_flash"] < 200_000
+    return fstat["total_flash"]-fstat["used_flash"] < 200_000 + file_size
 
 def delete(path):
     os.remove(path)
+    fileops.invalidate( path )
     _check_midi_file( path )
+    staticindex.invalidate( path )
+    dirindex.file_removed( path )
 
 # def purge_tunelib_file( fn ):
 #     def append( fn, n ):
@@ -308,16 +414,122 @@ def delete(path):
 #     _check_midi_file( from_fn )
 #     os.rename( from_fn, append(to_fn, n) )
    
-def make_tarball( tar_file, filelist ):
-    # Make tar_file as tarball of all files in filelist. 
-    from tarfile import TarFile
-    # Should never overwrite existing files (except another tar file)
-    # Javascript client ensures .tar extension
-    assert tar_file.endswith(".tar")
-    try:
-        os.remove(tar_file)
-    except OSError:
-        pass
-    with TarFile(tar_file, "w") as tar:
-        for filename in filelist:
-            tar.add( filename )
+# Tarballs are not written to flash, the tar stream is generated
+# while sending it. The browser first posts the file list with
+# prepare_tarball() and then downloads the tarball with
+# a plain link to /download_tarball/<token>
+_TAR_BUFFER = const(4096)
+_ZERO_BLOCK = b"\0" * 512
+_tar_request = None
+
+def prepare_tarball( filelist, tar_name, compress ):
+    # Only one tarball can be pending, a new request replaces the old one.
+    global _tar_request
+    from random import getrandbits
+    # The firmware may not include compression
+    compress = compress and fileops.can_compress()
+    if compress:
+        tar_name += ".gz"
+    token = hex(getrandbits(24))[2:]
+    _tar_request = ( token, filelist, tar_name, compress )
+    return {"url": f"/download_tarball/{token}"}
+
+def download_tarball( token ):
+    global _tar_request
+    if not _tar_request or _tar_request[0] != token:
+        raise ValueError("No tarball requested")
+    _, filelist, tar_name, compress = _tar_request
+    _tar_request = None
+    blocks = _tar_blocks( filelist )
+    if compress:
+        blocks = _gzip_blocks( blocks )
+    return blocks, 200, {
+        "Content-Type": "application/gzip" if compress else "application/x-tar",
+        "Content-Disposition": f'attachment; filename="{tar_name}"'}
+
+def _tar_blocks( filelist ):
+    # Generator for a ustar archive of all files in filelist.
+    # All data goes through one buffer, which is reused for each
+    # chunk, so there are no allocations per file nor per chunk.
+    # (microdot sends each chunk before asking for the next one)
+    buffer = bytearray(_TAR_BUFFER)
+    mvb = memoryview(buffer)
+    zeros = _ZERO_BLOCK
+    for filename in filelist:
+        try:
+            stat = os.stat( filename )
+            file = open( filename, "rb" )
+        except OSError:
+            # Deleted since the file list was shown
+            continue
+        size = stat[6]
+        with file:
+            if not _tar_header( mvb, filename, size, 
+                        timezone.esp32_to_unix( stat[8] ) ):
+                continue
+            yield mvb[0:512]
+            while True:
+                n = file.readinto( buffer )
+                if not n:
+                    break
+                yield mvb[0:n]
+        # Pad to multiple of 512 bytes
+        if size % 512:
+            yield zeros[0:512 - size % 512]
+    # End of archive: two blocks of zeros
+    yield zeros
+    yield zeros
+
+def _tar_header( mvb, filename, size, mtime ):
+    # Fill a ustar header in mvb[0:512], return False if 
+    # the name does not fit.
+    name = filename.lstrip("/").encode()
+    prefix = b""
+    if len(name) > 100:
+        # Split path in prefix (folder) and name
+        p = name.find( b"/", len(name) - 101 )
+        if p < 0 or p > 155:
+            return False
+        prefix = name[0:p]
+        name = name[p+1:]
+    mvb[0:512] = _ZERO_BLOCK
+    mvb[0:len(name)] = name
+    _tar_octal( mvb, 100, 8, 0o644 ) # mode
+    _tar_octal( mvb, 108, 8, 0 ) # uid
+    _tar_octal( mvb, 116, 8, 0 ) # gid
+    _tar_octal( mvb, 124, 12, size )
+    _tar_octal( mvb, 136, 12, mtime )
+    # Checksum is calculated with spaces in the checksum field
+    mvb[148:156] = b"        "
+    mvb[156] = ord("0") # regular file
+    mvb[257:265] = b"ustar\x0000"
+    mvb[345:345+len(prefix)] = prefix
+    _tar_octal( mvb, 148, 7, sum( mvb[0:512] ) )
+    return True
+
+def _tar_octal( mvb, start, length, value ):
+    # Octal number with leading zeros, terminated by NUL
+    digits = length - 1
+    mvb[start:start+digits] = f"{value:0{digits}o}".encode()
+    mvb[start+digits] = 0
+
+def _gzip_blocks( blocks ):
+    # Compress the output of a generator on the fly
+    import io
+    from deflate import DeflateIO, GZIP
+    class Sink(io.IOBase):
+        # Collects compressed data
+        def __init__( self ):
+            self.chunks = []
+        def write( self, data ):
+            self.chunks.append( bytes(data) )
+            return len(data)
+    sink = Sink()
+    gz = DeflateIO( sink, GZIP )
+    for block in blocks:
+        gz.write( block )
+        while sink.chunks:
+            yield sink.chunks.pop(0)
+    gz.close()
+    while sink.chunks:
+        yield sink.chunks.pop(0)
@@ -2,16 +2,84 @@
 # MIT License
 from micropython import const
 import json
-import asyncio
 import errno
 import os
 import time
 
 from deflate import DeflateIO, AUTO
-import scheduler
 
+# Previous versions of a file are kept as filename-1 and filename-2,
+# used in turn. Formerly, daily copies such as config.json-2023-10-23
+# were kept, read_json() still uses those to recover a file.
 _KEEP_OLD_VERSIONS = const(2)
 
+# json files up to this size are kept in RAM, as json text.
+# read_json() parses the text instead of reading flash, and
+# write_json() does not write if the content did not change.
+_CACHE_MAX_SIZE = const(32_000)
+
+# key=filename, value=generation, the last slot used is
+# filename-(generation%_KEEP_OLD_VERSIONS+1)
+_generations = {}
+# key=filename, value=json text of the file
+_json_cache = {}
+
+# Result of os.stat() for file_exists() and folder_exists(), so
+# repeated checks, such as for each /get_progress, don't touch flash.
+# Modules that create, rename or delete files call invalidate(),
+# write_json() does it by itself.
+_NOT_FOUND = const(0)
+_FILE = const(1)
+_FOLDER = const(2)
+# key=path, value=_NOT_FOUND, _FILE or _FOLDER
+_path_types = {}
+# Limit for the cache, the tunelib folder has many files
+_MAX_PATHS = const(100)
+
+def _key( filename ):
+    # "data/x.json" and "/data/x.json" are the same file
+    return filename.lstrip("/")
+
+def _backup_slots( filename ):
+    return [ f"{filename}-{n+1}" for n in range(_KEEP_OLD_VERSIONS) ]
+
+def _mtime( filename ):
+    try:
+        return os.stat( filename )[8]
+    except OSError:
+        return -1
+
+def _replace( source, destination ):
+    try:
+        os.rename( source, destination )
+    except OSError:
+        # Some file systems don't replace an existing file
+        try:
+            os.remove( destination )
+        except OSError:
+            pass
+        os.rename( source, destination )
+
+def invalidate( filename ):
+    # Must be called when a file is created, changed, renamed
+    # or deleted without write_json(), for example by the file manager
+    key = _key( filename )
+    _json_cache.pop( key, None )
+    _path_types.pop( key, None )
+
+def _path_type( path ):
+    key = _key( path )
+    path_type = _path_types.get( key )
+    if path_type is None:
+        try:
+            path_type = _FOLDER if os.stat( path )[0] == 16384 else _FILE
+        except OSError:
+            path_type = _NOT_FOUND
+        if len(_path_types) >= _MAX_PATHS:
+            _path_types.clear()
+        _path_types[key] = path_type
+    return path_type
+
 def backup(filename):
     # organtuner: for each note tuned
     # pinout: only when saving user input
@@ -20,31 +88,41 @@ def backup(filename):
     # tunemanager: when updating tunelib and when saving
     #              user data.
     #              Updating history has no backup.
-    from drehorgel import timezone
-    if not file_exists(filename):
+    # Move filename to the next backup slot. After a reboot, the
+    # slot with the older file is used first.
+    key = _key( filename )
+    generation = _generations.get( key )
+    if generation is None:
+        mtimes = [ _mtime( f ) for f in _backup_slots( filename ) ]
+        generation = mtimes.index( min( mtimes ) ) - 1
+        _purge_dated_backups( filename )
+    generation += 1
+    try:
+        _replace( filename, _backup_slots( filename )[generation % _KEEP_OLD_VERSIONS] )
+    except OSError:
+        # No file to backup
         return
-    # Make a daily backup
-    backup_filename = f"{filename}-{timezone.now_ymd()}"
-    if not file_exists(backup_filename):
-        os.rename(filename, backup_filename)
-
-    # Purging old backup files doesn't need to be done
-    # immediately, do it a bit later...
-    asyncio.create_task(delete_old_versions(filename))
+    _generations[key] = generation
+    invalidate( filename )
 
 def file_exists(filename):
-    try:
-        open(filename).close()
-        return True
-    except OSError:
-        return False
+    return _path_type( filename ) == _FILE
 
 def folder_exists(folder):
     # Check if folder exists, i.e. is a directory
+    return _path_type( folder ) == _FOLDER
+
+def _recovery_files( filename ):
+    # Files to try if filename can't be read, newest first.
+    # A complete temporary file means that write_json() was
+    # interrupted before renaming it.
+    yield filename + ".tmp"
+    yield from sorted( _backup_slots( filename ), key=_mtime, reverse=True )
+    # Daily backups of previous versions of this software
     try:
-         open(folder).close()
-    except OSError as e:
-        return e.errno == errno.EISDIR
+        yield find_latest_backup( filename )
+    except OSError:
+        pass
 
 def read_json(filename, default=None, recreate=False):
     # Read json file, or backups if error.
@@ -52,42 +130,83 @@ def read_json(filename, default=None, recreate=False):
     #   if default: will return the default
     #   if recreate and default: will rewrite the file, no backup
     #   else: raise error
+    key = _key( filename )
+    text = _json_cache.get( key )
+    if text is not None:
+        # Parsing is much faster than reading flash. 
+        # Each caller gets a new object.
+        return json.loads( text )
     try:
         with open(filename) as file:
-            return json.load(file)
+            text = file.read()
+        j = json.loads( text )
+        if len(text) <= _CACHE_MAX_SIZE:
+            _json_cache[key] = text
+        return j
     except (OSError, ValueError):
-        # Will raise OSError(ENOENT) if no file found
+        pass
+    for f in _recovery_files( filename ):
         try:
-            f = find_latest_backup(filename)
             with open(f) as file:
                 j = json.load(file)
-                print(f"fileops.read_json using backup file {f}")
-                return j
         except (OSError, ValueError):
-            if default is not None:
-                if recreate:
-                    write_json( default, filename )
-                return default
-            raise
+            continue
+        print(f"fileops.read_json using backup file {f}")
+        if f.endswith(".tmp"):
+            # Complete the interrupted write_json()
+            _replace( f, filename )
+            invalidate( f )
+            invalidate( filename )
+        return j
+    if default is not None:
+        if recreate:
+            write_json( default, filename )
+        return default
+    raise OSError( errno.ENOENT )
 
 
 def write_json(json_data, filename, keep_backup=True):
+    # The file is written to a temporary file and then renamed, so
+    # filename has either the old or the new content, even if power
+    # fails while writing.
+    key = _key( filename )
+    text = json.dumps( json_data )
+    if _json_cache.get( key ) == text:
+        # Same content as in flash
+        return
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "w") as file:
+        file.write( text )
     if keep_backup:
         backup(filename)
-    with open(filename, "w") as file:
-        json.dump(json_data, file)
-
-
-async def delete_old_versions(filename):
-    # Request time slice and wait indefinitely for it.
-    async with scheduler.RequestSlice("backup", 500):
-        matched_files = get_all_backup_files(filename)
-        while len(matched_files) > _KEEP_OLD_VERSIONS:
-            await asyncio.sleep_ms(1)
-            delete_file = matched_files.pop(0)
-            os.remove(delete_file)
-            print("fileops - old backup file deleted", delete_file)
-
+    _replace( temp_filename, filename )
+    _path_types[key] = _FILE
+    if len(text) <= _CACHE_MAX_SIZE:
+        _json_cache[key] = text
+    else:
+        _json_cache.pop( key, None )
+
+
+def write_text( text, filename ):
+    # Write a text file, with a temporary file as write_json()
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "w") as file:
+        file.write( text )
+    _replace( temp_filename, filename )
+    invalidate( filename )
+
+
+def _purge_dated_backups( filename ):
+    # Previous versions of this software kept a backup per day,
+    # like "config.json-2023-10-23". Keep only the newest one,
+    # read_json() uses it if there is no other copy.
+    # Called once for each file after a reboot.
+    try:
+        for f in get_all_backup_files( filename )[:-1]:
+            os.remove( f )
+            invalidate( f )
+    except OSError:
+        pass
 
 def get_all_backup_files(filename):
     path = filename.split("/")
@@ -95,8 +214,9 @@ def get_all_backup_files(filename):
     folder = filename[0 : -len(path[-1])]
     matched_files = []
     # Search for filenames like "config.json-2023-10-23"
-    # Compare strings up to the "-", i.e. "config.json-"
-    search_for = filename + "-"
+    # Compare strings up to the year, i.e. "config.json-20",
+    # the backup slots "config.json-1" are not included.
+    search_for = filename + "-20"
     # ilistdir() takes same time as listdir(). 
     for fn in os.listdir(folder):
         f = folder + fn
@@ -119,6 +239,7 @@ def make_folder( folder ):
         os.mkdir( folder )
     except OSError:
         pass
+    invalidate( folder )
 
 def copy_file( source, destination ):
     # Copy file from source to destination
@@ -127,6 +248,7 @@ def copy_file( source, destination ):
     with open(source, "rb") as src:
         with open(destination, "wb") as dst: # type:ignore
             dst.write(src.read())
+    invalidate( destination )
 
 # def copy_folder( src_folder, dst_folder, overwrite=False ):
 #         for fn in  os.listdir(src_folder):
@@ -139,6 +261,11 @@ def copy_file( source, destination ):
 def is_folder( folder_name ):
     return os.stat( folder_name )[0] == 16384
 
+def can_compress():
+    # Writing to DeflateIO needs MICROPY_PY_DEFLATE_COMPRESS
+    # in the firmware, see tools/fix_mp_romfs.py
+    return hasattr( DeflateIO, "write" )
+
 def decompress_midi( filename, temp_filename ):
     # Will first return filename of .mid file, if it exists.
     # iI not, will add .gz (if not present) and
@@ -158,6 +285,7 @@ def decompress_midi( filename, temp_filename ):
     # until the next file is decompressed.
     with open( temp_filename, "wb") as output:  # type:ignore
         output.write(data)
+    invalidate( temp_filename )
     return temp_filename
 
 def open_midi( filename ):
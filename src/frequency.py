@@ -138,6 +138,7 @@ def save( signal, duration, midi_note, step, prefix=_HIRES_FILE_PREFIX ):
         # Write data, one integer per line.
         for v in signal:
             file.write(f"{round(v)}\n")
+    fileops.invalidate( filename )
             
 def compute_amplitude( signal ):
     avgsignal =  sum( s for s in signal )/len(signal)
@@ -150,5 +151,6 @@ def clear_stored_signals():
     try:
         for filename in os.listdir(_SIGNAL_FOLDER):
             os.remove(_SIGNAL_FOLDER + "/" + filename)
+            fileops.invalidate( _SIGNAL_FOLDER + "/" + filename )
     except OSError:
         pass
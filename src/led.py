@@ -176,6 +176,8 @@ def set_led( pin ):
         # Write led.txt only if pin definition is different
         with open(_LED_FILE, "w") as file:
             file.write(str(pin))
+        import fileops
+        fileops.invalidate( _LED_FILE )
 
 def get_led():
     try:
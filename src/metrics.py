@@ -0,0 +1,94 @@
+# Copyright (c) 2026 Hermann von Borries
+# MIT license
+
+# Metrics of the web server per route, always on, see /metrics.
+# Each route pattern has one record, a list of integers of fixed
+# size, so memory does not grow with the number of requests.
+# The number of records is limited by the routes of webserver.py.
+# Handler time is the time from admission (see admission.py) until
+# the response is ready, sending the response is not included.
+from micropython import const
+
+# Record fields
+_COUNT = const(0)
+_PLAYING = const(1) # requests while a tune was playing
+_ERRORS = const(2) # status code 400 or more, or exception
+_BYTES = const(3) # response bytes, if known before sending
+_WAITED = const(4) # total msec waiting for admission
+_TOTAL = const(5) # total msec in handler
+_AVERAGE = const(6) # moving average of handler time, msec
+_MAX = const(7) # maximum handler time, msec
+_HISTOGRAM = const(8) # start of histogram of handler time
+# Upper limits of the histogram buckets in msec,
+# there is one more bucket for longer times.
+_BUCKETS = ( 10, 30, 100, 300, 1000, 3000 )
+_RECORD_SIZE = const(15) # _HISTOGRAM + len(_BUCKETS) + 1
+_NAMES = ( "count", "playing", "errors", "bytes", "waited",
+           "total", "average", "max" )
+
+# key=route pattern, value=record
+_records = {}
+# Moving average of handler time of all routes, msec
+_recent_average = 0
+
+def _get( route ):
+    record = _records.get( route )
+    if record is None:
+        record = [0] * _RECORD_SIZE
+        _records[route] = record
+    return record
+
+def average( route ):
+    # Average handler time of the route in msec, None if not known.
+    record = _records.get( route )
+    if record and record[_COUNT]:
+        return record[_AVERAGE]
+
+def recent_average():
+    # Average handler time of the last requests of any route, msec.
+    return _recent_average
+
+def add_wait( route, msec ):
+    _get( route )[_WAITED] += msec
+
+def add_request( route, msec, status_code, bytes_out, playing ):
+    global _recent_average
+    _recent_average = ( 7*_recent_average + msec ) // 8
+    record = _get( route )
+    if record[_COUNT]:
+        record[_AVERAGE] = ( 7*record[_AVERAGE] + msec ) // 8
+    else:
+        record[_AVERAGE] = msec
+    record[_COUNT] += 1
+    if playing:
+        record[_PLAYING] += 1
+    if status_code >= 400:
+        record[_ERRORS] += 1
+    record[_BYTES] += bytes_out
+    record[_TOTAL] += msec
+    record[_MAX] = max( record[_MAX], msec )
+    i = 0
+    while i < len(_BUCKETS) and msec > _BUCKETS[i]:
+        i += 1
+    record[_HISTOGRAM+i] += 1
+
+def _sorted_records():
+    # Routes that cost most device time first
+    return sorted( _records.items(), key=lambda item: -item[1][_TOTAL] )
+
+def get_json():
+    routes = {}
+    for route, record in _sorted_records():
+        d = dict( zip( _NAMES, record ) )
+        d["histogram"] = record[_HISTOGRAM:]
+        routes[route] = d
+    return { "buckets": _BUCKETS, "routes": routes }
+
+def get_text():
+    # One line per route: route and values in the order of _NAMES,
+    # then the histogram.
+    header = "route " + " ".join( _NAMES ) + " histogram(<=" + ",<=".join( str(b) for b in _BUCKETS ) + ",more)"
+    return "\n".join( [header] + [
+        route + " " + " ".join( str(v) for v in record[0:_HISTOGRAM] )
+        + " " + ",".join( str(v) for v in record[_HISTOGRAM:] )
+        for route, record in _sorted_records() ] )
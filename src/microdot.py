@@ -11,12 +11,9 @@ servers for MicroPython and standard Python.
 import asyncio
 import io
 import json
+import os
 import time
 
-# >>> using await while playing
-from scheduler import play_yield
-print("Microdot: using await for Request._safe_readline()")
-
 try:
     from inspect import iscoroutinefunction, iscoroutine
     from functools import partial
@@ -363,6 +360,9 @@ class Request:
         #: A general purpose container for applications to store data during
         #: the life of the request.
         self.g = Request.G()
+        #: The URL pattern of the route that matched the request, set
+        #: when the route is found.
+        self.url_pattern = None
 
         self.http_version = http_version
         if '?' in self.path:
@@ -410,14 +410,10 @@ class Request:
         # headers
         headers = NoCaseDict()
         content_length = 0
+        # The header is read without yielding to the MIDI player for
+        # each line, the application decides with a before_request
+        # handler if the request has to wait for the player.
         while True: 
-            # >>> make readline more async friendly
-            # >>> if not, get_progress() interferes with 
-            # >>> MIDI player.
-            # >>> Following line added to improve asyncio response
-            # >>> Version 1.29: impact seems to be nil.
-            await play_yield()
-            # >>> end of change
             line = (await Request._safe_readline(
                     client_reader)).strip().decode()
 
@@ -529,6 +525,54 @@ class Request:
         return line
 
 
+class _FileRange:
+    # File-like object that returns at most length bytes from the
+    # current position of a file. Used by Response.send_file() to
+    # serve a byte range. All chunks are read into the same buffer,
+    # the response sends each chunk before reading the next one.
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+        self.buffer = None
+
+    def read(self, size):
+        if self.buffer is None or len(self.buffer) != size:
+            self.buffer = memoryview(bytearray(size))
+        n = self.file.readinto(self.buffer[:min(size, self.remaining)])
+        if not n:
+            self.remaining = 0
+            return b''
+        self.remaining -= n
+        return self.buffer[:n]
+
+    def close(self):
+        self.file.close()
+
+
+def _byte_range(range_header, size):
+    # Parse a Range header with a single byte range. Returns
+    # (first, last), or None if the header is not understood, in that
+    # case the complete file is sent. Raises ValueError if the range
+    # cannot be satisfied.
+    unit, _, spec = range_header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    first, _, last = spec.strip().partition('-')
+    try:
+        if first:
+            first = int(first)
+            last = int(last) if last else size - 1
+        else:
+            # Suffix range: the last n bytes
+            first = max(size - int(last), 0)
+            last = size - 1
+    except ValueError:
+        return None
+    if first > last or first >= size:
+        raise ValueError('range not satisfiable')
+    return first, min(last, size - 1)
+
+
 class Response:
     """An HTTP response class.
 
@@ -569,6 +613,12 @@ class Response:
     #: written to the client. Used to exit WebSocket connections cleanly.
     already_handled = None
 
+    #: Buffer where the status line, the headers and a short body are
+    #: assembled to be sent with a single write. The stream's ``awrite()``
+    #: copies the data before yielding, so one buffer serves all connections.
+    header_buffer_size = 1024
+    _header_buffer = None
+
     def __init__(self, body='', status_code=200, headers=None, reason=None):
         if body is None and status_code == 200:
             body = ''
@@ -652,19 +702,46 @@ class Response:
             # status code
             reason = self.reason if self.reason is not None else \
                 ('OK' if self.status_code == 200 else 'N/A')
-            await stream.awrite('HTTP/1.0 {status_code} {reason}\r\n'.format(
-                status_code=self.status_code, reason=reason).encode())
+            lines = ['HTTP/1.1 {status_code} {reason}\r\n'.format(
+                status_code=self.status_code, reason=reason)]
 
             # headers
             for header, value in self.headers.items():
                 values = value if isinstance(value, list) else [value]
                 for value in values:
-                    await stream.awrite('{header}: {value}\r\n'.format(
-                        header=header, value=value).encode())
-            await stream.awrite(b'\r\n')
+                    lines.append('{header}: {value}\r\n'.format(
+                        header=header, value=value))
+            lines.append('\r\n')
+
+            # Assemble status line and headers, and the body if it is
+            # short, and send with as few writes as possible.
+            if Response._header_buffer is None:
+                Response._header_buffer = memoryview(
+                    bytearray(Response.header_buffer_size))
+            buffer = Response._header_buffer
+            size = len(buffer)
+            body_sent = False
+            if not self.is_head and isinstance(self.body, bytes) and \
+                    len(self.body) <= size:
+                lines.append(self.body)
+                body_sent = True
+            n = 0
+            for line in lines:
+                data = line.encode() if isinstance(line, str) else line
+                length = len(data)
+                if n + length > size:
+                    await stream.awrite(buffer[:n])
+                    n = 0
+                    if length > size:
+                        await stream.awrite(data)
+                        continue
+                buffer[n:n + length] = data
+                n += length
+            if n:
+                await stream.awrite(buffer[:n])
 
             # body
-            if not self.is_head:
+            if not self.is_head and not body_sent:
                 iter = self.body_iter()
                 async for body in iter:
                     if isinstance(body, str):  # pragma: no cover
@@ -756,7 +833,7 @@ class Response:
     @classmethod
     def send_file(cls, filename, status_code=200, content_type=None,
                   stream=None, max_age=None, compressed=False,
-                  file_extension=''):
+                  file_extension='', request=None):
         """Send file contents in a response.
 
         :param filename: The filename of the file.
@@ -783,6 +860,10 @@ class Response:
                                parameter when opening the file, including the
                                dot. The extension given here is not considered
                                when generating the ``Content-Type`` header.
+        :param request: The request. If given and the file is opened by this
+                        method, the ``Range`` and ``If-Range`` headers of the
+                        request are honored and a ``206 Partial Content``
+                        response is returned for a byte range.
 
         Security note: The filename is assumed to be trusted. Never pass
         filenames provided by the user without validating and sanitizing them
@@ -808,8 +889,50 @@ class Response:
             headers['Content-Encoding'] = compressed \
                 if isinstance(compressed, str) else 'gzip'
 
-        f = stream or open(filename + file_extension, 'rb')
-        return cls(body=f, status_code=status_code, headers=headers)
+        if stream is None:
+            # With a known length, the connection can be kept alive
+            stat = os.stat(filename + file_extension)
+            size = stat[6]
+            headers['Content-Length'] = str(size)
+            if request is not None:
+                return cls._send_range(filename + file_extension, size,
+                                       stat[8], status_code, headers,
+                                       request)
+            stream = open(filename + file_extension, 'rb')
+        return cls(body=stream, status_code=status_code, headers=headers)
+
+    @classmethod
+    def _send_range(cls, filename, size, mtime, status_code, headers,
+                    request):
+        # The ETag changes when the file is replaced, so a download
+        # is only resumed if the file is still the same.
+        etag = '"{:x}-{:x}"'.format(mtime, size)
+        headers['ETag'] = etag
+        headers['Accept-Ranges'] = 'bytes'
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if range_header and request.headers.get('If-Range', etag) == etag:
+            try:
+                byte_range = _byte_range(range_header, size)
+            except ValueError:
+                headers['Content-Range'] = 'bytes */{}'.format(size)
+                headers['Content-Length'] = '0'
+                return cls(body=b'', status_code=416, headers=headers,
+                           reason='Range Not Satisfiable')
+        if byte_range is None:
+            first, last = 0, size - 1
+        else:
+            first, last = byte_range
+            status_code = 206
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                first, last, size)
+            headers['Content-Length'] = str(last - first + 1)
+        file = open(filename, 'rb')
+        if first:
+            file.seek(first)
+        return cls(body=_FileRange(file, last - first + 1),
+                   status_code=status_code, headers=headers,
+                   reason='Partial Content' if status_code == 206 else None)
 
 
 class URLPattern():
@@ -930,6 +1053,19 @@ class Microdot:
         app = Microdot()
     """
 
+    #: Seconds a kept alive connection can be idle before it is closed.
+    keepalive_timeout = 5
+
+    #: Keep-alive is only used while at most this number of connections
+    #: are open. With more connections open, each response closes its
+    #: connection.
+    keepalive_connection_limit = 3
+
+    #: Maximum number of connections served at the same time. Further
+    #: connections wait until one is closed, so that requests don't pile
+    #: up work that competes with the MIDI player.
+    max_connections = 6
+
     def __init__(self):
         self.url_map = []
         self.before_request_handlers = []
@@ -940,6 +1076,8 @@ class Microdot:
         self.options_handler = self.default_options_handler
         self.debug = False
         self.server = None
+        self.connections = 0
+        self.connection_closed = asyncio.Event()
 
     def route(self, url_pattern, methods=None):
         """Decorator that is used to register a function as a request handler
@@ -1326,6 +1464,7 @@ class Microdot:
             if req.url_args is not None:
                 if method in route_methods:
                     f = route_handler
+                    req.url_pattern = route_pattern.url_pattern
                     break
                 else:
                     f = 405
@@ -1342,27 +1481,75 @@ class Microdot:
         return {'Allow': ', '.join(allow)}
 
     async def handle_request(self, reader, writer):
-        req = None
+        # Serve requests on this connection until the client closes it,
+        # the connection is idle for more than keepalive_timeout, or
+        # a response can't be kept alive.
+        while self.connections >= self.max_connections:
+            self.connection_closed.clear()
+            await self.connection_closed.wait()
+        self.connections += 1
+        first = True
+        keep_alive = True
         try:
-            req = await Request.create(self, reader, writer,
-                                       writer.get_extra_info('peername'))
-        except Exception as exc:  # pragma: no cover
-            print_exception(exc)
-
-        res = await self.dispatch_request(req)
-        if res != Response.already_handled:  # pragma: no branch
-            await res.write(writer)
-        try:
-            await writer.aclose()
-        except OSError as exc:  # pragma: no cover
-            if exc.errno in MUTED_SOCKET_ERRORS:
-                pass
-            else:
-                raise
-        if self.debug and req:  # pragma: no cover
-            print('{method} {path} {status_code}'.format(
-                method=req.method, path=req.path,
-                status_code=res.status_code))
+            while keep_alive:
+                req = None
+                try:
+                    req = await asyncio.wait_for(
+                        Request.create(self, reader, writer,
+                                       writer.get_extra_info('peername')),
+                        self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except Exception as exc:  # pragma: no cover
+                    if not first:
+                        # Connection lost while idle
+                        break
+                    print_exception(exc)
+                if req is None and not first:
+                    # Client closed the kept alive connection
+                    break
+                first = False
+
+                res = await self.dispatch_request(req)
+                keep_alive = self._keep_alive(req, res)
+                if res != Response.already_handled:  # pragma: no branch
+                    res.headers['Connection'] = \
+                        'keep-alive' if keep_alive else 'close'
+                    await res.write(writer)
+                if self.debug and req:  # pragma: no cover
+                    print('{method} {path} {status_code}'.format(
+                        method=req.method, path=req.path,
+                        status_code=res.status_code))
+        finally:
+            self.connections -= 1
+            self.connection_closed.set()
+            try:
+                await writer.aclose()
+            except OSError as exc:  # pragma: no cover
+                if exc.errno in MUTED_SOCKET_ERRORS:
+                    pass
+                else:
+                    raise
+
+    def _keep_alive(self, req, res):
+        # Decide if the connection stays open after this response
+        if req is None or res == Response.already_handled or \
+                self.connections > self.keepalive_connection_limit:
+            return False
+        connection = req.headers.get('Connection', '').lower()
+        if req.http_version == '1.0':
+            if connection != 'keep-alive':
+                return False
+        elif connection == 'close':
+            return False
+        # A request body that was not read would be taken
+        # as the next request.
+        if req.content_length > Request.max_body_length:
+            return False
+        # Without Content-Length the client can only see the end of
+        # the body when the connection closes.
+        res.complete()
+        return 'Content-Length' in res.headers
 
     async def dispatch_request(self, req):
         after_request_handled = False
@@ -9,6 +9,7 @@ from random import choice
 from midi import  DRUM_CHANNEL, DRUM_PROGRAM, NoteDef
 from umidiparser import NOTE_OFF, NOTE_ON, PROGRAM_CHANGE
 from actuatorstats import ActuatorStats
+import progresscache
 
 # Allocate a NoteDef once (instead of creating a new one for each note on and off event) to avoid
 CURRENT_NOTE = NoteDef(0,0)
@@ -20,6 +21,12 @@ class Register:
         # is the "always on" default register
         # with name "" 
         self.current_value = not name
+        # Actions governed by this register, filled by MIDIController.
+        # Each entry is a 3-tuple:
+        #   the list of enabled actions of a MIDI note
+        #   the action to add to/remove from that list when the register changes
+        #   the actuator, to turn off when the register is turned off
+        self.actions = []
 
     def set_gpio_pin( self, gpio_number ):
         # Update gpio pin only of not defined already
@@ -63,13 +70,30 @@ class Register:
                 self.set_value( not pv )
                 last_value = pv
     
-    def set_controller( self, controller ):
-        self.controller = controller 
+    def add_action( self, enabled_actions, action, actuator ):
+        # Called by MIDIController to index the actions of this register
+        self.actions.append( (enabled_actions, action, actuator) )
+        if self.current_value:
+            enabled_actions.append( action )
 
     def set_value( self, new_value ):
+        # Changing a register takes time proportional to the number of
+        # actuators of this register, the other MIDI notes are not looked at.
+        new_value = bool(new_value)
+        if new_value == bool(self.current_value):
+            return
         self.current_value = new_value
-        if new_value == 0 and self.name:
-            self.controller._all_off_for_register( self.name )
+        if self.name:
+            # Named registers are shown on the web pages
+            progresscache.mark_dirty()
+        for enabled_actions, action, actuator in self.actions:
+            if new_value:
+                enabled_actions.append( action )
+            else:
+                enabled_actions.remove( action )
+                if self.name:
+                    # Turn off even if there is pending note off count...
+                    actuator.force_off()
         
 # Class for all registers
 class RegisterBank:
@@ -92,13 +116,6 @@ class RegisterBank:
             (r.name, r.value()) 
             for r in self.register_dict.values() if r.name]
     
-    def set_midicontroller( self, controller ):
-        # Set the MIDI controller for all registers
-        # This is done here to avoid circular imports
-        # and to keep the register class simple
-        for reg in self.register_dict.values():
-            reg.set_controller( controller )
-
 class MIDIController:
     # The MIDI controller takes care of MIDI note on
     # and note off events, heeding registers
@@ -115,6 +132,11 @@ class MIDIController:
         #   the nominal midi note (a NoteDef object) 
         #
         self.notedict = {}
+        # self.enabled_notedict has the same keys as self.notedict,
+        # but holds only the actions whose register is on, 
+        # as 2-tuples (actuator.off, actuator.on). Registers add and
+        # remove actions here when they change.
+        self.enabled_notedict = {}
 
         # Passthrough driver callback (ex: for a synthesizer)
         # There can be only one (i.e. not a list)
@@ -128,6 +150,7 @@ class MIDIController:
     # each note
     def define_start( self ):
         self.notedict = {}
+        self.enabled_notedict = {}
 
     def define_note( self, midi_note, actuator, register_name="" ):  
         reg = self.register_bank.factory( register_name )
@@ -157,16 +180,23 @@ class MIDIController:
         for virtual_pin in FauxTomDriver( actuator_bank ):
             # Faux Toms are not controlled by a register, use "always on" register.
             self.define_note( virtual_pin.nominal_midi_note, virtual_pin, "" )
-        self.register_bank.set_midicontroller( self )
+
+        # Index all actions by register
+        self.enabled_notedict = {}
+        for midi_note, actions in self.notedict.items():
+            enabled_actions = []
+            self.enabled_notedict[midi_note] = enabled_actions
+            for off, on, reg, actuator in actions:
+                reg.add_action( enabled_actions, (off, on), actuator )
          
     def _get_actions( self, midi_note ):
         # Use the note's program number in the key (specific search). 
         # If this does not work,
         # use WILDCARD_PROGRAM in the key to match
         # midi note definitions in pinout with wildcard program number.
-        # If that doesn't work either, return a empty list (no note will sound) 
-        return self.notedict.get( midi_note, 
-               self.notedict.get( midi_note.wildcard(), []))
+        # If that doesn't work either, return None (no note will sound) 
+        return self.enabled_notedict.get( midi_note, 
+               self.enabled_notedict.get( midi_note.wildcard() ))
 
 
     def file_start( self, midifile ):
@@ -219,18 +249,19 @@ class MIDIController:
     def _notedef_onoff( self, midi_note, onoff ): 
         # onoff: 0 for note off, 1 for note on, see order in self.define_note()
         actions = self._get_actions( midi_note )
+        if actions is None:
+            # Note not defined
+            return False
+        # Only actions of registers that are on are in the list.
         for act in actions:
             # act[0] is actuator.off()
             # act[1] is actuator.on()
-            # act[2] is register
-            # act[3] is the actuator (not used here, since the on/off methods are available)
-            if act[2].value():
-                # This calls the on() or off() method of the appropriate driver/actuator
-                act[onoff]()
-        # Return True to caller if a note was played. 
+            # This calls the on() or off() method of the appropriate driver/actuator
+            act[onoff]()
+        # Return True to caller if the note is defined.
         # This is used here for passthrough and in organtuner.py
         # to skip notes that are not present while playing scales.
-        return bool(actions)          
+        return True
 
     def _note_event_on( self, midi_event ):
         return self._note_event( midi_event, 1 )
@@ -273,6 +304,11 @@ class MIDIController:
     def all_notes_off( self ):
         self.actuator_bank.all_notes_off( )
 
+    def flush( self ):
+        # Called by player when all events of a group
+        # of simultaneous events have been processed.
+        self.actuator_bank.flush()
+
     async def play_random_note(self, duration_msec):
         if not hasattr( self, "all_midis" ):
             # Cache a list of all MIDI notes for future use in self.play_random_note()
@@ -296,15 +332,3 @@ class MIDIController:
     def get_notedict(self):
         # Used by webserver to list pinout
         return self.notedict
-
-    def _all_off_for_register( self, register_name ):
-        # Turn off all notes for a given register. 
-        # This is used when a register is turned off, to turn off
-        # all actuators related to this register.
-        # This takes about 1 or 2 msec, plus time to force_off,
-        # so no much gain if optimized
-        for actions in self.notedict.values():
-           for actuator, register, _ in actions:
-                if register.name == register_name:
-                    # Turn off even if there is pending note off count...
-                    actuator.force_off()
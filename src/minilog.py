@@ -82,8 +82,16 @@ class getLogger:
             if (cls._current_log_num - n) >= _KEEP_FILES:
                 filename = cls._makefilename(n)
                 os.remove(filename)
+                cls._invalidate(filename)
                 cls.log(__name__, "INFO", f"old log {filename} deleted")
 
+    @classmethod
+    def _invalidate(cls, filename):
+        # Log files are created and deleted here, not with fileops.
+        # Late import, minilog must be usable before anything else.
+        import fileops
+        fileops.invalidate(filename)
+
     @classmethod
     def _makefilename(cls, n):
         return f"{_FOLDER}error{n}.log"
@@ -129,6 +137,7 @@ class getLogger:
         # If maximum filesize exceeded with this write, switch to new file
         cls._current_log_num += 1
         filename = cls._makefilename(cls._current_log_num)
+        cls._invalidate(filename)
         cls.log( __name__, "DEBUG", f"now logging to log file {filename}" )
 
 
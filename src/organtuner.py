@@ -7,6 +7,7 @@ import os
 import asyncio
 from math import log10
 import time
+from random import getrandbits
 
 if __name__ == "__main__":
     import sys
@@ -43,6 +44,20 @@ def avg(lst):
 class OrganTuner:
     def __init__(self, microphone_pin ):
         self.logger = getLogger(__name__)
+        # Tuning with calculated fields, as sent to the browser, one
+        # dict per pin. A pin is calculated again when tuned, all
+        # pins when a value that affects all pins changes:
+        # the maximum amplitude (0 dB), the tuning frequency or
+        # config.mic_signal_low.
+        self.tuning_view = []
+        self.view_key = None
+        # Pins that must be calculated again
+        self.stale_pins = set()
+        # Version of the tuning, incremented when a pin changes.
+        # Random start, to be different after reboot.
+        self.tuning_version = getrandbits(20) + 1
+        # Version of the last change of each pin
+        self.pin_versions = []
         self._get_stored_tuning()
         self.tuner_queue = []
         self.start_tuner_event = asyncio.Event()
@@ -201,6 +216,7 @@ class OrganTuner:
             os.remove(config.ORGANTUNER_JSON)
         except OSError:
             pass
+        fileops.invalidate(config.ORGANTUNER_JSON)
         frequency.clear_stored_signals()
         # Recreate organtuner.json
         self._get_stored_tuning()
@@ -286,6 +302,11 @@ class OrganTuner:
                 fileops.write_json(
                     self.stored_tuning, config.ORGANTUNER_JSON, keep_backup=False
                 )
+        # Calculate all pins again
+        self.tuning_version += 1
+        self.pin_versions = [self.tuning_version] * len(self.stored_tuning)
+        self.tuning_view = [None] * len(self.stored_tuning)
+        self.stale_pins = set( range( len(self.stored_tuning) ) )
         return
 
     async def update_tuning(self, pin_index ):
@@ -304,6 +325,9 @@ class OrganTuner:
         fileops.write_json(
             self.stored_tuning, config.ORGANTUNER_JSON, keep_backup=False
         )
+        self.tuning_version += 1
+        self.pin_versions[pin_index] = self.tuning_version
+        self.stale_pins.add( pin_index )
         self.logger.info(f"completed update_tuning {actuator=} {midi_note=} stored in flash")
 
     def calcdb(self, amp, maxamp):
@@ -369,51 +393,76 @@ class OrganTuner:
        
         return freqlist, amplist
 
-    def get_organtuner_json( self ):
+    def get_organtuner_json( self, since=None ):
         # Return updated tuning to the browser.
         # The browser does not fetch organtuner.json
-        return self._calculate_tuning()
+        # If since is given, returns {"version": current version,
+        # "pins": {pin_index: tuning of pin}} with the pins changed
+        # after that version.
+        tuning = self._calculate_tuning()
+        if since is None:
+            return tuning
+        if since > self.tuning_version:
+            # Version of before a reboot, send all pins
+            since = 0
+        return { "version": self.tuning_version,
+                 "pins": { pin_index: tuning[pin_index]
+                           for pin_index, version in enumerate( self.pin_versions )
+                           if version > since } }
     
     def _calculate_tuning(self):
         # Do calculated fields here:
         #  ampdb, amplistdb, cents, centslist
-        # The calculated fields are done on the fly when
-        # browser asks for values. 
+        # The calculated fields are done when the
+        # browser asks for values, only for pins that changed.
         # Calculated fields are not stored, they depend on too many variables.
-        # Make a deep copy of stored_tuning, so the stored_tuning remains small.
-        tuning = list( dict(v) for v in self.stored_tuning )
         # Find the global maximum amplitude of all notes. That value sets 0 dB
         maxamp = 1
-        for v in tuning:
+        for v in self.stored_tuning:
             for amp in v["amplist"]:
                 if amp is None:
                     self.logger.info(f"Amplitude must be != None {amp=} {v=}")
                 if amp and amp > maxamp:
                     maxamp = amp
 
-        for v in tuning:
-            # Reconstruct a NoteDef for the MIDI note to get frequency, cents, tuning
-            midi_note = NoteDef(v.get("program_number",0), v["midi_number"])
-            
-            # Calculate frequency (adjusted by tuning frequency)
-            # and use that to calculate cents
-            v["frequency"] = midi_note.frequency()
-            freqlist = v.setdefault("freqlist", [])
-            centslist = [ midi_note.cents(f) for f in freqlist ]
-            v["measured_freq"] = avg(freqlist)
-
-            # Calculate an average amplitude, convert to db
-            amplist = v.setdefault("amplist", [])
-            avgamp = avg(amplist)
-            v["ampdb"] = self.calcdb(avgamp, maxamp)
-
-            # Make a list of all amplitudes converted to db
-            v["amplistdb"] = [self.calcdb(amp, maxamp) for amp in amplist]
-
-            v["cents"] = avg(centslist)
-            v["centslist"] = centslist
-        # Calculated values are not stored
-        return tuning
+        view_key = ( maxamp, NoteDef.tuning_frequency, config.mic_signal_low )
+        if view_key != self.view_key:
+            if self.view_key is not None:
+                # All pins change
+                self.tuning_version += 1
+                self.pin_versions = [self.tuning_version] * len(self.stored_tuning)
+            self.view_key = view_key
+            self.stale_pins = set( range( len(self.stored_tuning) ) )
+
+        for pin_index in self.stale_pins:
+            self.tuning_view[pin_index] = self._calculate_pin( pin_index, maxamp )
+        self.stale_pins.clear()
+        return self.tuning_view
+
+    def _calculate_pin( self, pin_index, maxamp ):
+        # Make a copy of stored_tuning, so the stored_tuning remains small.
+        v = dict( self.stored_tuning[pin_index] )
+        # Reconstruct a NoteDef for the MIDI note to get frequency, cents, tuning
+        midi_note = NoteDef(v.get("program_number",0), v["midi_number"])
+        
+        # Calculate frequency (adjusted by tuning frequency)
+        # and use that to calculate cents
+        v["frequency"] = midi_note.frequency()
+        freqlist = v.setdefault("freqlist", [])
+        centslist = [ midi_note.cents(f) for f in freqlist ]
+        v["measured_freq"] = avg(freqlist)
+
+        # Calculate an average amplitude, convert to db
+        amplist = v.setdefault("amplist", [])
+        avgamp = avg(amplist)
+        v["ampdb"] = self.calcdb(avgamp, maxamp)
+
+        # Make a list of all amplitudes converted to db
+        v["amplistdb"] = [self.calcdb(amp, maxamp) for amp in amplist]
+
+        v["cents"] = avg(centslist)
+        v["centslist"] = centslist
+        return v
     
     def set_avg_frequency( self ):
         # Set average frequency. Reset by next reboot.
@@ -302,6 +302,7 @@ class PinoutList:
         fileops.backup(self.pinout_txt_filename)
         with open(self.pinout_txt_filename, "w") as file:
             file.write(new_pinout_filename)
+        fileops.invalidate(self.pinout_txt_filename)
         # Change takes effect at next reboot
 
     def get_saved_pinout_filename(self):
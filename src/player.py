@@ -13,6 +13,7 @@ from minilog import getLogger
 from drehorgel import tunemanager, controller, battery, history, crank, config, timezone
 
 import scheduler
+import progresscache
 from midi import DRUM_PROGRAM, DRUM_CHANNEL, NoteDef
 from fileops import open_midi
 from actuatorstats import ActuatorStats
@@ -28,15 +29,19 @@ class MIDIPlayerProgress:
 
     def tune_started(self, tuneid):
         self.progress = {"tune": tuneid, "playtime": 0, "status": _PLAYING}
+        progresscache.mark_dirty()
 
     def tune_ended(self):
         self.progress["status"] = _ENDED
+        progresscache.mark_dirty()
 
     def tune_cancelled(self):
         self.progress = {"tune": None, "playtime": 0, "status": _CANCELLED}
+        progresscache.mark_dirty()
 
     def report_exception(self, message):
         self.progress["status"] = message
+        progresscache.mark_dirty()
 
     def get(self):
         self.progress["boot_session"] = self.boot_session
@@ -143,6 +148,7 @@ class MIDIPlayer:
             self.tempo_follows_crank = config.tempo_follows_crank
             self.repeats_requested = 1
             self.repeat_count = 0
+            progresscache.mark_dirty()
 
             # scheduler.fdump() # for debug 
             
@@ -175,18 +181,29 @@ class MIDIPlayer:
         sum_real_waits = 0
         sum_scheduled_waits = 0
         midi_events = 0
+        # Show playtime on the web pages every second
+        progress_us = 0
         for midi_event in midifile:
             midi_events += 1
             # time_played_us goes from 0 to the length of the midi file in microseconds
             # and is not affected by playback speed. Is used to calculate
             # % of tune played.
             self.time_played_us += midi_event.delta_us # type:ignore
+            if self.time_played_us >= progress_us:
+                progress_us = self.time_played_us + 1_000_000
+                progresscache.mark_dirty()
 
             # An optimization. For example, often there are many control changes
             # (up to 100)
             # with 0 delta time. Skip these to avoid delays.
             if midi_event.delta_us == 0 and not controller.must_process(midi_event):
                 continue
+
+            if midi_event.delta_us:
+                # All events of the previous group of simultaneous
+                # events have been processed. Send what drivers have
+                # buffered before waiting.
+                controller.flush()
             
             # midi_time is the calculated MIDI time since the start of the MIDI file
             # Without tachometer: midi_time += midi_event.delta_us    
@@ -231,6 +248,7 @@ class MIDIPlayer:
 
             controller.process_midi( midi_event )
 
+        controller.flush()
         total = ticks_diff(ticks_ms(),msec_start) 
         busy = total - sum_real_waits/1000
         self.logger.info(f"MIDI processing: {midi_events=}, msec/event={round(busy/midi_events, 1)}, busy={round(busy/total*100,1)}%, avg gc={scheduler.avg_gc_time} msec, late ratio={round((sum_real_waits/sum_scheduled_waits-1)*100,2)}% {self.repeat_count=}")
@@ -340,10 +358,12 @@ class MIDIPlayer:
         # set by webserver
         # Can override config but cannot override if not started by crank
         self.tempo_follows_crank = v and crank.is_installed() and self.started_by_crank
+        progresscache.mark_dirty()
 
     def change_repeats_requested( self, v ):
         # called by webserver,with v +1 or -1
         self.repeats_requested = max( 1, self.repeats_requested + v )
+        progresscache.mark_dirty()
       
     def set_started_by_crank( self, v ):
         # False if crank not installed
@@ -353,3 +373,4 @@ class MIDIPlayer:
         
         # Can't use  "tempo follows crank" if tune not started by crank
         self.tempo_follows_crank = self.tempo_follows_crank and self.started_by_crank
+        progresscache.mark_dirty()
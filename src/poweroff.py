@@ -67,6 +67,8 @@ class PowerManager:
             
     async def _wait_and_action(self, action):
         setlist.stop_tune()
+        # Changes of the setlist not yet written to flash
+        setlist.flush()
         controller.all_notes_off()
         led.shutdown()
         # Wait for web server to respond, led to flash, etc
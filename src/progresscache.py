@@ -0,0 +1,92 @@
+# Copyright (c) 2026 Hermann von Borries
+# MIT license
+
+# Cached progress for the web pages.
+# The sources of progress information (player, crank, setlist,
+# registers, tunemanager, battery) call mark_dirty() when a field
+# they report changes. The progress is then gathered and serialized
+# once, on the next request, and shared by all clients:
+# /get_progress answers with the same bytes (or 304 Not Modified)
+# and /progress_events compares fields with the previous snapshot.
+# A change also wakes up clients waiting in wait_change().
+#
+# This is a separate lightweight module so that the sources
+# don't need to import webserver.py.
+import asyncio
+import json
+from time import ticks_ms, ticks_diff, ticks_add
+from random import getrandbits
+
+# Function that gathers progress, set by webserver.py
+_builder = None
+# Set by mark_dirty(), cleared when the snapshot is rebuilt
+_dirty = True
+# Incremented each time the progress changes.
+version = 0
+# Snapshot of progress, key=field, value=json of the field.
+# A new dict is made for each change, so a client
+# may keep a reference to the last snapshot it got.
+snapshot = {}
+# Serialized snapshot as sent by /get_progress
+_json = b"{}"
+# ETag of _json. Versions restart at 0 on each reboot, the
+# random prefix makes ETags of a previous boot invalid.
+_etag_prefix = hex(getrandbits(24))[2:]
+_etag = ""
+_changed = asyncio.Event()
+
+def set_builder( builder ):
+    global _builder
+    _builder = builder
+
+def mark_dirty():
+    # Called by the sources of progress when something changed.
+    # Must be fast, this may be called while a tune is playing.
+    global _dirty
+    if not _dirty:
+        _dirty = True
+        # Wake up all clients waiting for this change
+        _changed.set()
+        _changed.clear()
+
+def refresh():
+    # Rebuild snapshot if a source marked itself as dirty
+    global _dirty, version, snapshot, _json, _etag
+    if not _dirty:
+        return
+    _dirty = False
+    new_snapshot = { k:json.dumps(v) for k,v in _builder().items() }
+    if new_snapshot != snapshot:
+        snapshot = new_snapshot
+        version += 1
+        _json = ( "{"
+            + ",".join( f'"{k}":{v}' for k,v in snapshot.items() )
+            + "}" ).encode()
+        _etag = f'"{_etag_prefix}-{version}"'
+
+def get_json():
+    # Returns serialized progress and its ETag
+    refresh()
+    return _json, _etag
+
+def get_snapshot():
+    refresh()
+    return snapshot
+
+async def wait_change( known_version, timeout_msec ):
+    # Wait until the progress differs from known_version.
+    # Returns False on timeout.
+    deadline = ticks_add( ticks_ms(), timeout_msec )
+    while True:
+        refresh()
+        if version != known_version:
+            return True
+        # A source may mark itself dirty but the progress
+        # turns out to be the same, then wait again.
+        wait = ticks_diff( deadline, ticks_ms() )
+        if wait <= 0:
+            return False
+        try:
+            await asyncio.wait_for_ms( _changed.wait(), wait )
+        except asyncio.TimeoutError:
+            return False
@@ -8,6 +8,8 @@ from time import ticks_diff, ticks_us, ticks_ms, sleep_us
 import asyncio
 import gc
 
+import timerwheel
+
 _run_always_flag = True
 
 # Time that is spent waiting with precision timer.
@@ -34,12 +36,8 @@ _LONG_TIME = const(3_600_000)
 # If True, RequestSlice shows timing information.
 _DEBUG_TIMES = const(False)
 
-# Reading the response lines after the first line in Microdot
-# takes 150 to 300 msec in async but blocks sometimes for 50 msec
-# making this wait here late by around 50msec.
-# I patched Microdot with a small asyn delay for safe_read_line()
-# for the subsequent readlines. The initial readline() for the request line
-# does not cause problems. 
+# Web requests that take time wait for a RequestSlice before running,
+# see admission.py. 
 
 # Tally CPU used in time.sleep_us() for aioprof statistics
 
@@ -66,7 +64,10 @@ async def wait_and_yield_usec(for_usec):
         _find_and_run_task( async_time )
 
     # Wait until the time expires, yielding control.
+    # Meanwhile, run actions of the timer wheel with precision
+    # (drum notes releasing their valves).
     while ticks_diff( ticks_us(), t_start ) < for_usec:
+        timerwheel.run_due()
         await asyncio.sleep_ms(0) # better precision when using 0 msec
 
 def _find_and_run_task(async_time):
@@ -180,13 +181,6 @@ async def wait_for_player_inactive():
 def is_player_active():
     return not _run_always_flag
 
-async def play_yield():
-    # await a bit while player active to yield CPU to player
-    # Called from microdot.py
-    if _run_always_flag:
-        return
-    await asyncio.sleep_ms(20)
-
 # Class to measure time of a group of statements, use:
 # with MeasureTime("description") as m:
 #       statements
@@ -6,12 +6,15 @@
 import asyncio
 from random import randrange
 import os
+from time import ticks_ms, ticks_diff
 
 from drehorgel import config, tunemanager, crank, gpio, led, player
 
 from startbase import startButtonFactory
 from minilog import getLogger
 import fileops
+import progresscache
+import scheduler
 
 # def del_key(key, dictionary):
 #    if key in dictionary:
@@ -23,6 +26,11 @@ _STORED_SETLIST = const(1)
 # This constant must be equal to the same name defined in common.js
 _MAX_SETLIST_SLOTS = const(12)
 
+# Changes of the current setlist are written to flash when there
+# were no changes for this time (msec), so moving a tune through
+# a long setlist from the browser does not write flash for each step.
+_WRITE_DELAY = const(3_000)
+
 class Setlist:
     def __init__(self):
         self.logger = getLogger(__name__)
@@ -66,6 +74,17 @@ class Setlist:
         # Handle of the player currently playing a tune.
         # If None, no tune is playing
         self.player_task = None
+
+        # The current setlist is kept in RAM, changes are written to
+        # flash by the write behind task. The generation is incremented
+        # with each change and sent with the progress, so the browser
+        # can tell if its view of the setlist is stale. It starts
+        # at a random number to be different after a reboot.
+        self.generation = randrange(1_000_000)
+        self._unsaved = False
+        self._last_change = ticks_ms()
+        self._changed_event = asyncio.Event()
+        self.write_behind_task = asyncio.create_task( self._write_behind_process() )
         self.logger.debug("init ok")
 
 
@@ -82,10 +101,12 @@ class Setlist:
         # Record that we are waiting for tune to start
         # for progress.
         self.waiting_for_start_tune_event = True
+        progresscache.mark_dirty()
         # music_start_event must be set from now on
         self.music_start_event.clear()
         await self.music_start_event.wait() # type:ignore
         self.waiting_for_start_tune_event = False
+        progresscache.mark_dirty()
         return
     
     # The background setlist process - wait for start and play next tune
@@ -101,6 +122,7 @@ class Setlist:
         for slot, old_filename in enumerate(["/data/setlist_current.json","/data/setlist_stored.json" ]):
             try:
                 os.rename( old_filename, self.stored_setlist_filename(slot) )
+                fileops.invalidate( self.stored_setlist_filename(slot) )
             except OSError:
                 pass
 
@@ -239,12 +261,15 @@ class Setlist:
  
 
     def save(self, slot, slist=None ):
-        # setlist 0 is written twice at start of tune?
-        
-        # >>> consider guarding with RequestSlice in webserver.py
         if not( 0 <= slot < _MAX_SETLIST_SLOTS):
             raise ValueError
 
+        if slot == _CURRENT_SETLIST:
+            # Written later by _write_behind_process()
+            if slist is not None:
+                self.current_setlist = slist
+            self._save_current()
+            return
         # Save setlist in RAM to file
         filename = self.stored_setlist_filename( slot )
         fileops.write_json(
@@ -252,17 +277,56 @@ class Setlist:
         )
 
     def _save_current( self ):
-        self.save( _CURRENT_SETLIST )
+        self.generation += 1
+        self._unsaved = True
+        self._last_change = ticks_ms()
+        progresscache.mark_dirty()
+        self._changed_event.set()
+
+    def flush( self ):
+        # Write the current setlist to flash now, if changed.
+        # Called before power off and before reading the file.
+        if self._unsaved:
+            fileops.write_json( self.current_setlist,
+                self.stored_setlist_filename( _CURRENT_SETLIST ),
+                keep_backup=False )
+            # If write_json() fails, the next flush() tries again
+            self._unsaved = False
+
+    async def _write_behind_process( self ):
+        while True:
+            await self._changed_event.wait()
+            self._changed_event.clear()
+            # Wait until there are no more changes
+            while ( wait := _WRITE_DELAY - ticks_diff( ticks_ms(), self._last_change ) ) > 0:
+                await asyncio.sleep_ms( wait )
+            # Write in a gap of the music, if a tune is playing.
+            # flush() before power off writes if there was no gap.
+            try:
+                async with scheduler.RequestSlice( "setlist", 50 ):
+                    try:
+                        self.flush()
+                    except OSError as e:
+                        self.logger.exc( e, "could not save setlist" )
+            except RuntimeError:
+                # No gap for a very long time, try again
+                self._changed_event.set()
 
     def load(self, slot, into_current=True):
-        # >>> consider guarding with RequestSlice, better in webserver.py?
         # Read setlist from flash
+        if slot == _CURRENT_SETLIST:
+            # File must be up to date
+            self.flush()
         filename = self.stored_setlist_filename( slot )
         slist = fileops.read_json(filename, default=[])
         if into_current:
             self.current_setlist = slist
             self.logger.debug(f"Setlist {slot} loaded {len(self.current_setlist)} tunes")
-            self._save_current()
+            if slot == _CURRENT_SETLIST:
+                # Same content as the file, no need to save
+                progresscache.mark_dirty()
+            else:
+                self._save_current()
         return slist
     
     def clear(self):
@@ -385,6 +449,7 @@ class Setlist:
     # The webserver get_progress() calls this function.
     def complement_progress(self, progress):
         progress["setlist"] = self.current_setlist
+        progress["setlist_generation"] = self.generation
         # progress["tune_requests"] = {} 
         progress["automatic_delay"] = config.automatic_delay
         progress["playback_enabled"] = self.playback_enabled
@@ -457,6 +522,7 @@ class Setlist:
         if self.playback_enabled:
             self.logger.debug("Playback disabled, setlist process will stop")
         self.playback_enabled = False
+        progresscache.mark_dirty()
 
     def stored_setlist_filename( self, slot ):
         # used by mcserver
@@ -10,6 +10,7 @@ from minilog import getLogger
 from drehorgel import led
 from midi import DRUM_PROGRAM
 from driver_base import RCServoPin, BasePin, SolePin
+import timerwheel
 
 _logger = getLogger(__name__)
 
@@ -25,13 +26,17 @@ class ActuatorBank:
         self.pin_list = actuator_def.get_pin_list()
         self.driver_list = actuator_def.get_driver_list() 
         self.known_programs = actuator_def.known_programs
+        # Drivers that buffer output, for example MIDI serial,
+        # need flush() to send the buffer.
+        self.flush_list = [ drv.flush for drv in self.driver_list if hasattr( drv, "flush" ) ]
 
         # Inject configuration for pins
         RCServoPin.set_config( config )
         SolePin.set_config( config )
         BasePin.set_led( led )
-        BasePin.set_pinlist( self.pin_list )
 
+        # Deferred actions of pins, such as drum notes turning off
+        self.wheel_task = asyncio.create_task( timerwheel.wheel_process() )
 
         # Gather some info for diag.html
         pi = self.get_pin_info(", ")
@@ -42,6 +47,10 @@ class ActuatorBank:
         # It's distracting
         BasePin.set_led( None )
 
+        # Do pending deferred actions now, for example turn
+        # off drum notes that are sounding.
+        timerwheel.flush()
+
         # Some drivers have a very fast and
         # very effective "all notes off" 
         # method, for example MIDI output and MCP23017.
@@ -59,9 +68,15 @@ class ActuatorBank:
 
         # Reset state now that all notes are off
         SolePin.clear_active()
+        self.flush()
         
         BasePin.set_led( led )
 
+    def flush( self ):
+        # Send all output buffered by drivers
+        for flush in self.flush_list:
+            flush()
+
     def get_pin_info(self, sep):
         # Get summary of current devices for display
         pin_info = []
@@ -235,4 +250,4 @@ class PinTest:
             return "I2C not connected or no pull up resistors.)"
         i2c = SoftI2C( sda=Pin(sda), scl=Pin(scl)  )
         # return a list of hex addresses, example: "0x20, 0x21, 0x22"
-        return ", ".join( f"0x{addr:02x}" for addr in i2c.scan() )
\ No newline at end of file
+        return ", ".join( f"0x{addr:02x}" for addr in i2c.scan() )
@@ -0,0 +1,110 @@
+# Copyright (c) 2026 Hermann von Borries
+# MIT license
+
+# Index of the static files (html, js, css, images) served by
+# webserver.py. Maps each request path such as "index.html" to the file
+# that is served, so a request does not need to probe the
+# static folders for the file and for the compressed .gz version.
+# The index is built at startup and again after filemanager.py
+# uploads or deletes a file in a static folder.
+#
+# The ETag is a hash of the file content, calculated the first time
+# the file is requested. When the browser revalidates with
+# If-None-Match, the webserver can answer 304 without reading flash.
+from micropython import const
+import os
+import hashlib
+import binascii
+
+from microdot import Response
+import fileops
+
+# Index entry, a list
+_FILENAME = const(0)
+_COMPRESSED = const(1)
+_SIZE = const(2)
+_CONTENT_TYPE = const(3)
+_ETAG = const(4)
+
+_folders = ()
+# key=request path, value=index entry. None means: build again.
+_index = None
+
+def set_folders( folders ):
+    # Folders in order of priority, each ending with "/"
+    global _folders
+    _folders = folders
+    invalidate()
+
+def invalidate( path=None ):
+    # Called by filemanager.py when a file is changed. If path
+    # is given, the index is only rebuilt if it is in a static folder.
+    global _index
+    if path is None or any( path.startswith( f ) for f in _folders ):
+        _index = None
+
+def _content_type( filename, compressed ):
+    # Same content types as microdot.send_file() for uncompressed
+    # files, fileops for compressed files.
+    if compressed:
+        return fileops.get_mime_type( filename )
+    return Response.types_map.get( filename.split(".")[-1],
+                                   "application/octet-stream" )
+
+def _build():
+    global _index
+    _index = {}
+    for folder in _folders:
+        try:
+            entries = list( os.ilistdir( folder ) )
+        except OSError:
+            # Folder not present, this is normal
+            continue
+        # Uncompressed files take precedence over compressed
+        # files in the same folder, folders before in the
+        # list take precedence over folders after.
+        folder_index = {}
+        for entry in entries:
+            name = entry[0]
+            if entry[1] != 32768:
+                continue
+            filename = folder + name
+            try:
+                size = entry[3]
+            except IndexError:
+                # /rom has no size in ilistdir()
+                size = os.stat( filename )[6]
+            compressed = fileops.is_compressed( name )
+            path = fileops.filename_no_gz( name )
+            if compressed and path in folder_index:
+                continue
+            folder_index[path] = [ filename, compressed, size,
+                                   _content_type( path, compressed ), None ]
+        for path, index_entry in folder_index.items():
+            if path not in _index:
+                _index[path] = index_entry
+
+def _hash_file( filename ):
+    h = hashlib.sha256()
+    buffer = bytearray(1024)
+    mvb = memoryview(buffer)
+    with open( filename, "rb" ) as file:
+        while True:
+            n = file.readinto( buffer )
+            if not n:
+                break
+            h.update( mvb[0:n] )
+    # Strong ETag, 64 bits of the hash are enough
+    return '"' + binascii.hexlify( h.digest()[0:8] ).decode() + '"'
+
+def lookup( path ):
+    # Returns filename, compressed, size, content_type, etag
+    # for the request path, or None if there is no such file.
+    if _index is None:
+        _build()
+    index_entry = _index.get( path )
+    if index_entry is None:
+        return None
+    if index_entry[_ETAG] is None:
+        index_entry[_ETAG] = _hash_file( index_entry[_FILENAME] )
+    return index_entry
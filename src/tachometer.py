@@ -12,6 +12,7 @@ from machine import Encoder, Counter # type:ignore
 from minilog import getLogger
 from drehorgel import config
 from scheduler import is_player_active
+import progresscache
 
 # Factor to convert the milliseconds  to revolutions per second (rpsec)
 # and vice-versa. rpsec = _FACTOR/msec, msec = _FACTOR/rpsec
@@ -284,12 +285,18 @@ class Crank:
     async def _start_stop_monitor( self ):
          # This task sets/resets events when crank movement
          # starts and stops.
+         # rpsec as shown by play.html, with one decimal
+         shown_rpsec = 0
          while True:
             await asyncio.sleep_ms(100)
             r = self.td.get_rpsec()
+            if round(r*10) != shown_rpsec:
+                shown_rpsec = round(r*10)
+                progresscache.mark_dirty()
             if r <= config.lower_threshold_rpsec and not self.crank_stopped.is_set():
                 self.crank_stopped.set()
                 self.crank_turning.clear()
+                progresscache.mark_dirty()
             elif r >= config.higher_threshold_rpsec:
                 # Handle registered event
                 if config.wait_stop_turning:
@@ -305,6 +312,7 @@ class Crank:
                 if not self.crank_turning.is_set(): # optimize CPU
                     self.crank_stopped.clear()
                     self.crank_turning.set()
+                    progresscache.mark_dirty()
 
     def is_turning(self):
         return self.crank_turning.is_set()
@@ -349,6 +357,7 @@ class Crank:
         # f(100) => 2
         # Calculate the multiplier needed by get_normalized_rpsec
         self.tempo_multiplier = ui_vel * ui_vel / 10000 + ui_vel / 200 + 0.5
+        progresscache.mark_dirty()
 
     def complement_progress(self,progress):
         # Add crank information to progress, to be sent to the browser.
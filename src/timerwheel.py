@@ -0,0 +1,130 @@
+# Copyright (c) 2026 Hermann von Borries
+# MIT license
+
+# Timer wheel for short deferred actions of the actuator drivers,
+# for example releasing the valves of a simulated drum note or
+# stopping the PWM pulse of a RC servo after it has moved.
+#
+# Pending deadlines are held in a preallocated table, so
+# scheduling an action does not create a task nor any other object.
+# While a tune is playing, scheduler.wait_and_yield_usec() calls run_due()
+# each time it polls, giving a precision well below 1 msec.
+# When no tune is playing, the background task wheel_process()
+# does the same with asyncio.sleep_ms() precision, which is good enough
+# for tests from the web pages or for the startup clap.
+from micropython import const
+from time import ticks_ms, ticks_diff, ticks_add
+from array import array
+import asyncio
+
+from actuatorstats import ActuatorStats
+
+# Maximum number of pending actions. A drum note uses up to 2 slots,
+# each RC servo movement uses 1 slot.
+_SLOTS = const(128)
+# wheel_process() polls at most every _POLL_MSEC while actions are pending,
+# so that an action scheduled during the wait is not delayed much.
+_POLL_MSEC = const(10)
+# Used as "no deadline soon"
+_FAR_MSEC = const(1_000)
+
+# ticks_ms() of the deadline of each slot
+_deadlines = array("i", (0 for _ in range(_SLOTS)))
+# Function to call at the deadline, None if slot is free
+_callbacks = [None]*_SLOTS
+# Stack of free slot numbers
+_free = list(range(_SLOTS))
+# Earliest deadline of all pending actions
+_next_due = ticks_ms()
+# Set when an action is scheduled, wakes up wheel_process()
+_wakeup = asyncio.Event()
+# Actions that could not be scheduled because the wheel was full,
+# run_due() schedules them again when slots become free.
+_overflow = []
+
+def schedule( delay_msec, callback, call_if_full=True ):
+    # Call callback() (without arguments) in about delay_msec milliseconds.
+    # To avoid allocation, pass a bound method stored beforehand,
+    # i.e. self._release_cb = self._release and then schedule(t, self._release_cb)
+    # If the wheel is full, callback() is called now, better early
+    # than never. A callback that may call schedule() again must
+    # use call_if_full=False, it is then retried when there are free slots.
+    # Returns False if callback() was not scheduled nor called, because
+    # both the wheel and the overflow list are full. The caller
+    # must then do the action itself.
+    global _next_due
+    try:
+        slot = _free.pop()
+    except IndexError:
+        ActuatorStats.count( "timer wheel full" )
+        if call_if_full:
+            callback()
+        elif len(_overflow) < _SLOTS:
+            _overflow.append( callback )
+        else:
+            ActuatorStats.count( "timer wheel overflow full" )
+            return False
+        return True
+    due = ticks_add( ticks_ms(), delay_msec )
+    _deadlines[slot] = due
+    _callbacks[slot] = callback
+    if len(_free) == _SLOTS-1 or ticks_diff( due, _next_due ) < 0:
+        _next_due = due
+    ActuatorStats.max( "max timer wheel", _SLOTS - len(_free) )
+    _wakeup.set()
+    return True
+
+def run_due():
+    # Call all actions whose deadline has been reached.
+    # This is called very often, the usual case must be fast.
+    global _next_due
+    if len(_free) == _SLOTS:
+        return
+    now = ticks_ms()
+    if ticks_diff( now, _next_due ) < 0:
+        return
+    # A callback may schedule() again while looping,
+    # that will lower _next_due if necessary.
+    _next_due = ticks_add( now, _FAR_MSEC )
+    next_due = _next_due
+    for slot in range(_SLOTS):
+        callback = _callbacks[slot]
+        if callback is None:
+            continue
+        due = _deadlines[slot]
+        if ticks_diff( now, due ) >= 0:
+            _callbacks[slot] = None
+            _free.append( slot )
+            callback()
+        elif ticks_diff( due, next_due ) < 0:
+            next_due = due
+    if ticks_diff( next_due, _next_due ) < 0:
+        _next_due = next_due
+    # Schedule actions that did not fit before, now that slots are free
+    while _overflow and _free:
+        schedule( 0, _overflow.pop(0), False )
+
+def flush():
+    # Call all pending actions now, used by all notes off.
+    global _next_due
+    _next_due = ticks_ms()
+    for slot in range(_SLOTS):
+        _deadlines[slot] = _next_due
+    run_due()
+    # run_due() moved the actions waiting in the overflow list
+    # to the wheel, due now. Call them too.
+    run_due()
+
+def occupancy():
+    # Number of pending actions
+    return _SLOTS - len(_free)
+
+async def wheel_process():
+    # Background task to run pending actions when the player is not polling
+    while True:
+        if len(_free) == _SLOTS:
+            _wakeup.clear()
+            await _wakeup.wait()
+        wait = ticks_diff( _next_due, ticks_ms() )
+        await asyncio.sleep_ms( min( max( wait, 0 ), _POLL_MSEC ) )
+        run_due()
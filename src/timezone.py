@@ -163,6 +163,9 @@ class TimeZone:
         # Unix time is zero on 1/1/1970
         # 30 years in seconds = 946_684_800 (difference of epoch)
         return timestamp - 946_684_800
+
+    def esp32_to_unix( self, timestamp ):
+        return timestamp + 946_684_800
     
     # Implement a context manager to set time for a short time
     # Use:
@@ -10,6 +10,9 @@ import time
 import scheduler
 from minilog import getLogger
 import fileops
+import progresscache
+import dirindex
+import metrics
 from drehorgel import config, timezone
 
 # Design procedure to restore a ESP32 from scratch.
@@ -21,7 +24,6 @@ from drehorgel import config, timezone
 # >>> print setlist with lyrics
 # >>> print simple setlist (order, title, time)
 # >>> print complete setlist (author, genre, year, info, rating)
-# >>> save intermediate result if large sync?
 
 import sys
 
@@ -99,11 +101,51 @@ _TLOP_FILE_DELETE = const(2)
 _TLOP_REPLACE_FIELD = const(3) # see common.js SetlistMenu class
 _TLOP_SYNCALL = const(4)
 
+# Pace of the tunelib sync. When idle, files are processed during
+# _SYNC_BURST msec, then the sync yields to the webserver for about
+# the average time of a web request, between _MIN_YIELD and _MAX_YIELD.
+# While a tune plays or files are being uploaded, the sync pauses
+# after each changed file and a longer time after 10 changed files.
+_SYNC_BURST = const(200)
+_MIN_YIELD = const(10)
+_MAX_YIELD = const(100)
+# tunelib.json and the sync file are saved at least this often
+# during a sync (msec), an interrupted sync resumes from there.
+_CHECKPOINT_INTERVAL = const(30_000)
+
+# Maximum entries of the journal of tunelib changes. If the browser
+# asks for older changes, it must read tunelib.json again.
+_JOURNAL_SIZE = const(300)
+# Journal column value for a tune added, updated or deleted
+_ALL_COLUMNS = const(-1)
+
+# Column names for query(), the same as common.js
+_QUERY_COLUMNS = { "id": _TLCOL_ID, "title": _TLCOL_TITLE, 
+    "genre": _TLCOL_GENRE, "author": _TLCOL_AUTHOR, "year": _TLCOL_YEAR,
+    "time": _TLCOL_TIME, "filename": _TLCOL_FILENAME, 
+    "autoplay": _TLCOL_AUTOPLAY, "info": _TLCOL_INFO, 
+    "date": _TLCOL_DATEADDED, "rating": _TLCOL_RATING,
+    "size": _TLCOL_SIZE, "lyrics": _TLCOL_LYRICS }
+_QUERY_DEFAULT_COLUMNS = const("id,title,genre,author,year,time,info,date,rating,lyrics")
+# Search is insensitive to case and to the accents
+# in this list, as in tunelist.html
+_ACCENTS = { a: b for a, b in zip( 
+    "ÃÀÁÄÂÈÉËÊÌÍÏÎÒÓÖÔÙÚÜÛãàáäâèéëêìíïîòóöôùúüûÑñÇç",
+    "aaaaaeeeeiiiioooouuuuaaaaaeeeeiiiioooouuuunncc" ) }
+
+def _fold( text ):
+    # Lower case without accents, for search
+    return "".join( _ACCENTS.get( c, c ) for c in text ).lower()
+
+# Compressed tunelib.json is written in chunks of this size
+_EXPORT_CHUNK = const(4096)
+
 class TuneManager:
     def __init__(self):
         # config.TUNELIB_FOLDER: /tunelib, also could be /sd/tunelib
         # config.TUNELIB_JSON: data/tunelib.json
-        # config.LYRICS_JSON: data/lyrics.json 
+        # config.LYRICS_FOLDER: data/lyrics/, one file per tune with lyrics
+        # config.LYRICS_JSON: data/lyrics.json, lyrics of previous versions
         # config.SYNC_TUNELIB: If not there: no sync pending.
         #             If it contains [], sync checks all files
         #             If it contains a non-empty list, sync check all queued files.
@@ -112,30 +154,87 @@ class TuneManager:
         self.tunelib_progress = "Tunelib update not started"
         self.sync_task = asyncio.create_task(self._sync_process())
         self.sync_event = asyncio.Event()
-        self.tunelib_signature = ""
+        # The tunelib version is incremented each time tunelib.json
+        # is written. The browser compares this signature to know
+        # if the tunelib changed, it starts at 1 since 0 means
+        # "no information about tunelib" in the browser.
+        self.tunelib_signature = 1
+        # Journal of changes, entries are [version, tuneid, column].
+        # All changes after journal_start are in the journal.
+        self.journal = []
+        self.journal_start = self.tunelib_signature
+        # (tuneid, column) changed but not written yet to tunelib.json
+        self.pending_changes = []
+        # Parsed tunelib.json for query(), with the
+        # (size, mtime) of the file to know if it is current
+        self.query_tunelib = None
+        self.query_stamp = None
+        self.export_running = False
         self.empty_cache()
         self.midifile_cache_task = asyncio.create_task( self.midifile_cache_process() )
-        # Create tunelib.json and lyrics.json if not there,
+        # Create tunelib.json if not there,
         # to make javascript happy.
-        
-        if not fileops.file_exists( config.LYRICS_JSON ):
-            self._read_lyrics() 
+        fileops.make_folder( config.LYRICS_FOLDER )
+        self._migrate_lyrics()
         if not fileops.file_exists( config.TUNELIB_JSON ):
             self._read_tunelib()
         self.recent_changes = 0 # counts changes queued since last sync
         self.sync_count = 0 # activity counter
         self.logger.debug(f"init ok")
 
-    def _compute_tunelib_signature( self, tunelib ):
-        # A number that changes (well, almost always) when the tunelib changes.
-        # This is used as a very efficient method
-        # to detect changes in the tunelib.json file.
-        # Disregard  _TLCOL_HISTORY for hash because it does not mean a significant change.
-        # Add 1 to allow browser distinguish between "empty tunelib" and
-        # "no information about tunelib"=0
-        self.tunelib_signature = sum( sum(hash(x) for i,x in enumerate(tune) if i!=_TLCOL_HISTORY)  
-                                for tune in tunelib.values() ) + 1
-        
+    def _journal_change( self, tuneid, column=_ALL_COLUMNS ):
+        # Record a change of newtunelib during sync, see _new_version()
+        self.pending_changes.append( (tuneid, column) )
+
+    def _new_version( self ):
+        # tunelib.json was written, the pending changes
+        # are now part of the new version
+        self.tunelib_signature += 1
+        version = self.tunelib_signature
+        self.journal.extend( [version, tuneid, column] for tuneid, column in self.pending_changes )
+        self.pending_changes = []
+        excess = len(self.journal) - _JOURNAL_SIZE
+        if excess > 0:
+            self.journal_start = self.journal[excess-1][0]
+            del self.journal[0:excess]
+        progresscache.mark_dirty()
+
+    def tunelib_json_replaced( self ):
+        # tunelib.json was written outside _write_tunelib_json(),
+        # for example uploaded or deleted with the file manager.
+        # The journal does not have these changes, the browser
+        # must read all of tunelib.json again.
+        self.query_tunelib = None
+        self.pending_changes = []
+        self._new_version()
+        self.journal = []
+        self.journal_start = self.tunelib_signature + 1
+        self._remove_export()
+
+    def get_changes( self, since ):
+        # Changes of the tunelib after version "since", so the browser
+        # can update its copy of tunelib.json. "changes" has the
+        # tuneids changed, with the complete tune (None if deleted) or
+        # a dict with column:new value.
+        # If "full" is true, the changes are not available anymore
+        # and the browser must read tunelib.json again.
+        version = self.tunelib_signature
+        if not( self.journal_start <= since <= version ):
+            return { "version": version, "full": True }
+        changed_columns = {}
+        for v, tuneid, column in self.journal:
+            if v > since:
+                changed_columns.setdefault( tuneid, set() ).add( column )
+        tunelib = self._get_query_tunelib()
+        changes = {}
+        for tuneid, columns in changed_columns.items():
+            tune = tunelib.get( tuneid )
+            if tune is None or _ALL_COLUMNS in columns:
+                changes[tuneid] = tune
+            else:
+                changes[tuneid] = { column: tune[column] for column in columns }
+        return { "version": version, "full": False, "changes": changes }
+
     def _read_tunelib(self):
         tunelib = fileops.read_json(config.TUNELIB_JSON,
                                  default={},
@@ -146,21 +245,72 @@ class TuneManager:
                 self.logger.info(f"Tuneid incorrect, removing tunelib entry for {tuneid} {tune[ _TLCOL_FILENAME]} {tune[ _TLCOL_TITLE]}, must sync")
                 # Must sync and fill this entry again
                 del tunelib[tuneid]
+                # Not in the journal, browser must read all of tunelib.json
+                self.journal_start = self.tunelib_signature + 1
             # Fill columns if some very old format
             while len(tune) <  _TLCOL_COLUMNS:
                 tune.append("")
 
-        self._compute_tunelib_signature( tunelib )
         return tunelib
     
     def _write_tunelib_json(self, tunelib):
-        self._compute_tunelib_signature( tunelib )
         fileops.write_json(tunelib, config.TUNELIB_JSON, keep_backup=True)
+        self.query_tunelib = None
+        self._new_version()
+        self._remove_export()
+        # Show the date added in the file manager
+        dirindex.set_dates( config.TUNELIB_FOLDER,
+            ( (tune[_TLCOL_FILENAME], tune[_TLCOL_DATEADDED]) for tune in tunelib.values() ) )
     
-    def _read_lyrics( self ):
-        return fileops.read_json( config.LYRICS_JSON, 
-                                 default={}, 
-                                 recreate=True )
+    def _remove_export( self ):
+        # The compressed copy is made again when requested
+        try:
+            os.remove( config.TUNELIB_JSON_GZ )
+        except OSError:
+            pass
+        fileops.invalidate( config.TUNELIB_JSON_GZ )
+
+    def _lyrics_filename( self, tuneid ):
+        # tuneid comes from the browser, must not be a path
+        if ( len(tuneid) != 9 or tuneid[0] != "i"
+            or not all( c.isalpha() or c.isdigit() or c in "-_" for c in tuneid ) ):
+            raise ValueError(f"Invalid tuneid {tuneid}")
+        return f"{config.LYRICS_FOLDER}{tuneid}.txt"
+
+    def _migrate_lyrics( self ):
+        # Formerly, the lyrics of all tunes were in lyrics.json.
+        # Now each tune with lyrics has a file in config.LYRICS_FOLDER.
+        # lyrics.json is kept as backup, lyrics.json-1 or -2.
+        if not fileops.file_exists( config.LYRICS_JSON ):
+            return
+        for tuneid, lyrics in fileops.read_json( config.LYRICS_JSON, default={} ).items():
+            try:
+                self._write_lyrics( tuneid, lyrics )
+            except ValueError:
+                pass
+        fileops.backup( config.LYRICS_JSON )
+        self.logger.info("lyrics.json converted to one file per tune")
+        # The lyrics flag of the tunelib is updated with the next sync
+        self._queue_change( [_TLOP_SYNCALL,0,0,0] )
+
+    def _write_lyrics( self, tuneid, lyrics ):
+        filename = self._lyrics_filename( tuneid )
+        if lyrics:
+            fileops.write_text( lyrics, filename )
+            return
+        try:
+            os.remove( filename )
+        except OSError:
+            pass
+        fileops.invalidate( filename )
+
+    def get_lyrics( self, tuneid ):
+        # Lyrics of one tune, "" if none
+        try:
+            with open( self._lyrics_filename( tuneid ) ) as file:
+                return file.read()
+        except OSError:
+            return ""
 
     def get_info_by_tuneid(self, tuneid):
         # Used by player.py to get tune info and
@@ -242,6 +392,8 @@ class TuneManager:
                 and not fileops.is_compressed( filename )):
             self.logger.info(f"Dedup: erase file {filename}, duplicate with .gz")
             os.remove( config.TUNELIB_FOLDER + filename )
+            dirindex.file_removed( config.TUNELIB_FOLDER + filename )
+            fileops.invalidate( config.TUNELIB_FOLDER + filename )
             del filedict[filename]
             self.sync_count += 1
 
@@ -264,6 +416,8 @@ class TuneManager:
             except KeyError:
                 self.logger.info(f"File {filename} was already removed from tunelib.json")
                 return # No change
+            self._write_lyrics( tuneid, "" )
+            self._journal_change( tuneid )
             return "Deleting entry"
         
         # Get file date
@@ -307,6 +461,7 @@ class TuneManager:
         # Update filename, the file could now
         # have (or not) a .gz suffix and thus be different from before
         tune[ _TLCOL_FILENAME] = filename
+        self._journal_change( tuneid )
         return operation
 
     async def _sync_process(self):
@@ -348,11 +503,36 @@ class TuneManager:
 
             await self._sync_now()
 
+    def _is_busy( self ):
+        # Sync slowly if a tune is playing or files are being uploaded.
+        # filemanager is only imported when the file manager is used.
+        filemanager = sys.modules.get( "filemanager" )
+        return scheduler.is_player_active() or bool( filemanager and filemanager.is_uploading() )
+
+    async def _yield_after_burst( self, burst_start ):
+        # Returns the start time of the next burst
+        if time.ticks_diff( time.ticks_ms(), burst_start ) < _SYNC_BURST:
+            return burst_start
+        await asyncio.sleep_ms( min( max( metrics.recent_average(), _MIN_YIELD ), _MAX_YIELD ) )
+        return time.ticks_ms()
+
+    def _checkpoint( self, newtunelib, changed, processed ):
+        # Save the changes to tunelib.json made so far and delete the 
+        # processed entries from the sync file.
+        if changed:
+            self._write_tunelib_json(newtunelib)
+        # There may be more changes in the queue that were
+        # queued after _sync_now() started
+        stored_queue = self._read_sync_file()
+        del stored_queue[0:processed]
+        self._write_sync_file(stored_queue)
+
     async def _sync_now(self):
         await asyncio.sleep_ms(20) # let browser catch up
         # By default log to flash.
         changed = False
         newtunelib = self._read_tunelib()
+        self.pending_changes = []
         change_queue = self._read_sync_file()
         self.recent_changes = 0 # count changes since start of sync
         await asyncio.sleep_ms(20) # let browser catch up
@@ -374,16 +554,29 @@ class TuneManager:
             # i.e. delete one if both aaa.mid and aaa.mid.gz present
             self._dedup_midi_files( filedict )
             await asyncio.sleep_ms(50)
+            # Check lyrics flag of all tunes
+            changed = self._sync_lyrics( newtunelib )
             # Queue all existing files to see if some sync'ing is needed
-            change_queue.extend( (_TLOP_FILE_UPDATE, fn, size,0) for fn, size in filedict.items() )
-            # and queue all files that have been deleted
-            change_queue.extend( (_TLOP_FILE_DELETE, tune[ _TLCOL_FILENAME],-1,0) 
+            # and all files that have been deleted, instead of the "sync all".
+            stored_length = len(change_queue)
+            change_queue = [ tlop for tlop in change_queue if tlop[0] != _TLOP_SYNCALL ]
+            change_queue.extend( [_TLOP_FILE_UPDATE, fn, size,0] for fn, size in filedict.items() )
+            change_queue.extend( [_TLOP_FILE_DELETE, tune[ _TLCOL_FILENAME],-1,0] 
                                 for tune in newtunelib.values() 
                                 if tune[ _TLCOL_FILENAME] not in filedict )
+            del filedict
+            # Store this queue, so an interrupted sync resumes with
+            # the files not processed yet.
+            self._write_sync_file( change_queue + self._read_sync_file()[stored_length:] )
         await asyncio.sleep_ms(50) # let browser catch up
         n = 0
+        # Entries of change_queue processed and still in the sync file
+        processed = 0
+        burst_start = time.ticks_ms()
+        checkpoint_time = burst_start
         for op, p1,p2,p3 in change_queue:
             self.sync_count += 1
+            operation = None
             if op == _TLOP_FILE_UPDATE or op == _TLOP_FILE_DELETE:
                 # [_TLOP_FILE_UPDATE, p1:filename, p2:filesize, 0 ]
                 # [_TLOP_FILE_DELETE, p1:filename, 0, 0 ]
@@ -393,11 +586,6 @@ class TuneManager:
                     changed = True
                     n += 1
                     self._sync_progress( f"tunelib.json: {operation} {p1}" )
-                    await asyncio.sleep_ms(100)
-                    if n % 10 == 0:
-                        # Make asyncio responsive, for example,
-                        # if upload in progress. (don't)
-                        await asyncio.sleep_ms(1000)
 
             elif op == _TLOP_REPLACE_FIELD:
                 # Change data field in tunelib.json
@@ -407,6 +595,7 @@ class TuneManager:
                     # checked that p2 is a valid column number
                     # p1=tuneid, p2=tlcol, p3=new_value
                     newtunelib[p1][int(p2)] = p3
+                    self._journal_change( p1, int(p2) )
 
                     self.logger.debug(f"queued change applied ok, tuneid={p1} tcol={p2} new data={p3}]")
                     changed = True
@@ -421,29 +610,41 @@ class TuneManager:
             # is in this position. Just ignore, must do a sync all.
             
             
+            processed += 1
+            
             # Check if a related file has ben uploaded, postpone syncing
             # Priority of upload is higher than priority of sync.
             if self.recent_changes > 0:
                 self.logger.debug("Recent file uploads, postpone sync")
+                self._checkpoint( newtunelib, changed, processed )
                 return
 
-        changed = changed or self._sync_lyrics( newtunelib  )
-        await asyncio.sleep_ms(50)
+            if self._is_busy():
+                burst_start = time.ticks_ms()
+                if operation:
+                    await asyncio.sleep_ms(100)
+                    if n % 10 == 0:
+                        # Make asyncio responsive, for example,
+                        # if upload in progress.
+                        await asyncio.sleep_ms(1000)
+            else:
+                burst_start = await self._yield_after_burst( burst_start )
+
+            if time.ticks_diff( time.ticks_ms(), checkpoint_time ) > _CHECKPOINT_INTERVAL:
+                self._checkpoint( newtunelib, changed, processed )
+                self._sync_progress("Intermediate result saved to flash")
+                changed = False
+                processed = 0
+                checkpoint_time = time.ticks_ms()
 
         # Check that setlist has only valid tuneids
         from drehorgel import setlist 
         setlist.sync( newtunelib )
         await asyncio.sleep_ms(50)
+        # delete all changes that were processed this time
+        self._checkpoint( newtunelib, changed, processed )
         if changed:
-            self._write_tunelib_json(newtunelib)
             self._sync_progress("tunelib.json written back to flash" )
-        # delete all changes that were processed this time
-        # There may be more changes in the queue that were
-        # queued AFTER _sync_now() started
-        stored_queue = self._read_sync_file()
-        del stored_queue[0:len(change_queue)]
-
-        self._write_sync_file(stored_queue)
         
         # Last element of tunelib_progress MUST contain
         # ***end*** for javascript in browser to know
@@ -478,6 +679,10 @@ class TuneManager:
             self.logger.info( f"Hash collision, renaming {fn} to {newfn}, lucky day" )
             # Change filename to avoid hash collisions...
             os.rename(config.TUNELIB_FOLDER + fn, config.TUNELIB_FOLDER  + newfn)
+            dirindex.file_removed( config.TUNELIB_FOLDER + fn )
+            dirindex.file_changed( config.TUNELIB_FOLDER + newfn )
+            fileops.invalidate( config.TUNELIB_FOLDER + fn )
+            fileops.invalidate( config.TUNELIB_FOLDER + newfn )
             fn = newfn
             # Now hash function should be one-to-one, no collisions
         return tuneid, fn
@@ -500,32 +705,26 @@ class TuneManager:
 
 
     def save_lyrics( self, tuneid, new_lyrics ):
-        # Save lyrics for one tune
-        all_lyrics = self._read_lyrics()
-        all_lyrics[tuneid] = new_lyrics
-        fileops.write_json( all_lyrics, config.LYRICS_JSON, keep_backup=True )
-        # No need for get_lyrics function since
-        # javascript can get the complete lyrics.json 
-        # file as data and cache int.
-        del all_lyrics
+        # Save lyrics for one tune, the lyrics flag of
+        # tunelib.json is updated by the sync.
+        self._write_lyrics( tuneid, new_lyrics )
+        self._queue_change( [_TLOP_REPLACE_FIELD, tuneid, _TLCOL_LYRICS, 1 if new_lyrics else 0] )
     
     def _sync_lyrics( self, newtunelib ):
-        # Delete all lyrics where the tune has been deleted
-        all_lyrics = self._read_lyrics()
-        changes = set(all_lyrics.keys()) - set(newtunelib.keys())
-        for tuneid in changes:
-            del all_lyrics[tuneid]
-
-        if changes:
-            fileops.write_json( all_lyrics, config.LYRICS_JSON, keep_backup=True )
-            self._sync_progress( "Lyrics updated" )
+        # For a complete sync: delete lyrics of tunes not in
+        # the tunelib and mark all tunes that have lyrics.
+        # Lyrics of tunes deleted later are deleted with the tune.
+        lyrics_tuneids = set( filename[:-4] for filename in os.listdir( config.LYRICS_FOLDER )
+                              if filename.endswith(".txt") )
+        for tuneid in lyrics_tuneids - set(newtunelib.keys()):
+            self._write_lyrics( tuneid, "" )
+            self._sync_progress( f"Lyrics of {tuneid} deleted" )
         
-        # Mark all tunes that have lyrics
-        tunelib_changes = set( tune[ _TLCOL_ID] for tune in newtunelib.values() if bool(tune[ _TLCOL_LYRICS]) != bool(tune[ _TLCOL_ID] in all_lyrics))
+        tunelib_changes = set( tune[ _TLCOL_ID] for tune in newtunelib.values() if bool(tune[ _TLCOL_LYRICS]) != bool(tune[ _TLCOL_ID] in lyrics_tuneids))
         for tuneid in tunelib_changes:
-            newtunelib[tuneid][_TLCOL_LYRICS] = 1 if tuneid in all_lyrics else 0
+            newtunelib[tuneid][_TLCOL_LYRICS] = 1 if tuneid in lyrics_tuneids else 0
+            self._journal_change( tuneid, _TLCOL_LYRICS )
         
-        del all_lyrics
         # Caller must write tunelib.json back to flash if changed
         return bool(tunelib_changes)
     
@@ -542,10 +741,19 @@ class TuneManager:
         # and that sync must be run
         # This is triggered by file manager and web server
         # filelist is a list of [operation, path] pairs
-        self._queue_change( [ _TLOP_FILE_UPDATE,
-                                 fileops.get_basename(path), 
-                                 file_size,0] )
-        # sync process will wake up and process this file
+        self.queue_files_updated( [(path, file_size)] )
+
+    def queue_files_updated( self, path_sizes ):
+        # Queue a list of (path, file_size) of updated files
+        # with one read and write of the sync file.
+        # Used by the batch upload of the file manager.
+        change_queue = self._read_sync_file()
+        for path, file_size in path_sizes:
+            change_queue.append( [ _TLOP_FILE_UPDATE,
+                                    fileops.get_basename(path), 
+                                    file_size,0] )
+        self._write_sync_file(change_queue)
+        # sync process will wake up and process these files
         # Don't kick process - that way several changes are processed in one fell swoop
         # Empty cache just in case the changed file was in cache
         self.empty_cache()
@@ -573,11 +781,14 @@ class TuneManager:
         return fileops.read_json(config.SYNC_TUNELIB , default=[])
         
     def _write_sync_file(self, change_queue):
+        # sync_pending of progress depends on this file
+        progresscache.mark_dirty()
         if len(change_queue) == 0:
             try:
                 os.remove(config.SYNC_TUNELIB)
             except:
                 pass
+            fileops.invalidate(config.SYNC_TUNELIB)
             return
         fileops.write_json( change_queue,  config.SYNC_TUNELIB, keep_backup=False )
 
@@ -585,6 +796,110 @@ class TuneManager:
         # Return dictionary filename:date added for the benefit of filemanager.py
         return {tune[ _TLCOL_FILENAME]: tune[ _TLCOL_DATEADDED]
                 for tune in self._read_tunelib().values()}
+
+    def _get_query_tunelib( self ):
+        # Keep tunelib.json parsed while it does not change,
+        # parsing takes much longer than filtering.
+        try:
+            stat = os.stat( config.TUNELIB_JSON )
+            stamp = ( stat[6], stat[8] )
+        except OSError:
+            stamp = None
+        if self.query_tunelib is None or stamp != self.query_stamp:
+            self.query_tunelib = self._read_tunelib()
+            self.query_stamp = stamp
+        return self.query_tunelib
+
+    def query( self, filters, search="", sort="title", reverse=False, 
+               start=0, count=50, columns=None ):
+        # Query the tunelib on the server, so the browser does not
+        # need to load the complete tunelib.json.
+        #   filters: dict with column name and value that must be equal,
+        #       for example {"genre": "Tango", "autoplay": "1"}
+        #   search: text that the title must contain
+        #   sort: column name
+        #   columns: comma separated names of the columns to return
+        # Returns total number of tunes found, the list of column names
+        # and the rows from start to start+count, each row a list with 
+        # the values of the columns.
+        # Raises KeyError for unknown column names.
+        tlfilters = []
+        for name, value in filters.items():
+            tlcol = _QUERY_COLUMNS[name]
+            if tlcol == _TLCOL_AUTOPLAY:
+                value = value in ( "1", "true", "True" )
+            tlfilters.append( (tlcol, value) )
+        search = _fold( search )
+        tunes = [ tune for tune in self._get_query_tunelib().values()
+                  if all( tune[tlcol] == value for tlcol, value in tlfilters )
+                     and ( not search or search in _fold( tune[_TLCOL_TITLE] ) ) ]
+
+        tlsort = _QUERY_COLUMNS[sort]
+        if tlsort in ( _TLCOL_TIME, _TLCOL_SIZE, _TLCOL_LYRICS ):
+            # Numbers, may be "" if not known yet
+            key = lambda tune: tune[tlsort] if isinstance( tune[tlsort], int ) else 0
+        else:
+            key = lambda tune: _fold( str( tune[tlsort] ) )
+        tunes.sort( key=key, reverse=reverse )
+
+        names = ( columns or _QUERY_DEFAULT_COLUMNS ).split(",")
+        tlcols = [ _QUERY_COLUMNS[name] for name in names ]
+        return len(tunes), names, [ [ tune[tlcol] for tlcol in tlcols ]
+                                    for tune in tunes[start:start+count] ]
+
+    async def get_tunelib_export( self ):
+        # Returns the filename of tunelib.json compressed with gzip, 
+        # made when first requested after a change of the tunelib.
+        # Returns None if not available, then tunelib.json
+        # should be sent uncompressed.
+        if fileops.file_exists( config.TUNELIB_JSON_GZ ):
+            return config.TUNELIB_JSON_GZ
+        if ( self.export_running or not fileops.can_compress()
+             or not fileops.file_exists( config.TUNELIB_JSON ) ):
+            return
+        self.export_running = True
+        if scheduler.is_player_active():
+            # Compressing would hold the request for a long time,
+            # send tunelib.json now and have the .gz for the next request
+            asyncio.create_task( self._make_tunelib_export() )
+            return
+        return await self._make_tunelib_export()
+
+    async def _make_tunelib_export( self ):
+        # Compress tunelib.json to config.TUNELIB_JSON_GZ,
+        # returns the filename or None if not done.
+        from deflate import DeflateIO, GZIP
+        temp_filename = config.TUNELIB_JSON_GZ + ".tmp"
+        try:
+            stat = os.stat( config.TUNELIB_JSON )
+            buffer = bytearray( _EXPORT_CHUNK )
+            mvb = memoryview( buffer )
+            with open( config.TUNELIB_JSON, "rb" ) as file:
+                with open( temp_filename, "wb" ) as output:
+                    with DeflateIO( output, GZIP ) as gz:
+                        while True:
+                            n = file.readinto( buffer )
+                            if not n:
+                                break
+                            # Compressing takes CPU, give way to the player
+                            async with scheduler.RequestSlice( "export", 50, 10_000 ):
+                                gz.write( mvb[0:n] )
+            if os.stat( config.TUNELIB_JSON ) != stat:
+                # tunelib.json was written meanwhile
+                raise OSError( "tunelib.json changed" )
+            os.rename( temp_filename, config.TUNELIB_JSON_GZ )
+            fileops.invalidate( config.TUNELIB_JSON_GZ )
+        except (OSError, RuntimeError) as e:
+            # RuntimeError: no time slice, the next request will try again
+            self.logger.info( f"Could not write {config.TUNELIB_JSON_GZ} {e}" )
+            try:
+                os.remove( temp_filename )
+            except OSError:
+                pass
+            return
+        finally:
+            self.export_running = False
+        return config.TUNELIB_JSON_GZ
     
     async def midifile_cache_process( self ):
         from drehorgel import setlist
@@ -4,20 +4,29 @@
 
 # >>> check if multipart/form-data is better than shipping json.
 
-import os, sys, gc, asyncio
+import os, sys, gc, asyncio, json
 from time import ticks_ms, ticks_diff
+from micropython import const
 from random import getrandbits
 
 from microdot import Microdot, send_file, redirect, Request, urldecode_bytes
-# This is for filemanager, maximum file size to upload
-Request.max_content_length = 1_000_000
-Request.max_body_length = 1_000_000
+# This is for filemanager, maximum file size to upload. Uploads
+# are read from request.stream in chunks, so this needs no RAM.
+Request.max_content_length = 8_000_000
+# Bodies up to this size are read into RAM, for the json posts
+# of the web pages. Larger bodies (uploads) are streamed.
+Request.max_body_length = 50_000
 
 from compiledate import compiledate
 from minilog import getLogger
 import scheduler
 import fileops
+import progresscache
+import staticindex
+import admission
+import metrics
 from midi import NoteDef
+from actuatorstats import ActuatorStats
 
 # Everything is needed here
 from drehorgel import battery, tunemanager, config, history, setlist, player, crank
@@ -32,10 +41,19 @@ _logger = getLogger(__name__)
 # incremental software update and development
 # If one of these folders is not there, no significant overhead is incurred.
 STATIC_FOLDERS = ["/software/static/", "/rom/static/"]
+staticindex.set_folders( STATIC_FOLDERS )
 
 
 # Session is a dict, key=session_id, session data is a dict, for example {"login":True}
+# At most _MAX_SESSIONS are kept, when full, the least recently 
+# used session is dropped. Many clients may connect once at
+# a public event, for example, with a QR code.
+_MAX_SESSIONS = const(24)
 sessions = {}
+# ticks_ms() of the last request or progress event of any session,
+# None if there was none since boot
+_last_activity = None
+
 def get_session( request ):
     # Must use try/catch to get the cases where there is no session
     # This can happen with the first http request after a reboot.
@@ -44,9 +62,33 @@ def get_session( request ):
 MAX_AGE = config.max_age
 
 
+# Routes that take some time to process wait for a gap between MIDI
+# events while a tune is playing, see admission.py. The buttons of the
+# play page and the progress are answered right away.
+# Routes not listed here are medium.
+admission.classify( admission.CHEAP, (
+    "/", "/static/<filepath>", "/favicon.ico", "/favicon.png",
+    "/get_progress", "/progress_events", "/tunelib_sync_progress",
+    "/queue_tune", "/start_tune", "/stop_tune_setlist", "/back_setlist",
+    "/up_setlist/<tuneid>", "/down_setlist/<tuneid>", "/top_setlist/<tuneid>",
+    "/bottom_setlist/<tuneid>", "/drop_setlist/<tuneid>",
+    "/set_velocity_relative/<int:change>", "/tempo_follows_crank",
+    "/repeats_requested", "/toggle_register", "/get_current_config",
+    "/get_permission", "/verify_password", "/logout", "/can_compress",
+    # Uploads request a time slice for each chunk written to flash,
+    # their service time is the whole transfer and can't size admission.
+    "/upload/<path_filename>", "/upload_batch/<path>" ) )
+admission.classify( admission.HEAVY, (
+    "/diag", "/errorlog", "/wifi_scan", "/used_flash", "/scan_i2c",
+    "/listdir", "/listdir/", "/listdir/<path>", "/show_file/<path>",
+    "/download/<path>", "/prepare_tarball", "/download_tarball/<token>", "/delete_file",
+    "/start_tunelib_sync", "/save_tunelib", "/tunelib_query", "/tunelib_changes",
+    "/shuffle_all_tunes", "/shuffle_3stars", "/metrics" ) )
+
 # Shows webserver processing time (total time is much higher)
 @app.before_request
-def func_before_req( request ):
+async def func_before_req( request ):
+    await admission.admit( request )
     request.g.t0 = ticks_ms()
 
 
@@ -65,27 +107,69 @@ def func_after_req( request, response ):
         # 24+24=48 bits = 12 bytes hexa
         session_id = hex(getrandbits(24))[2:]+hex(getrandbits(24))[2:]
         response.set_cookie("session", session_id, path="/" )
-        # If password_required, then login starts as False
-        # If not password_required, then login will be always True
-        this_session = {"login":not config.password_required}
-        # Session information will be lost with each reboot, i.e.
-        # it is NOT kept in flash. This means a user is logged out
-        # on reboot.
-        sessions[session_id] = this_session
-    this_session["last_activity"] = ticks_ms()
+        this_session = _new_session( session_id )
+    _touch_session( this_session )
     this_session["ip"] = request.client_addr[0]
-    dt = ticks_diff( ticks_ms(), request.g.t0 )
-    _logger.debug(f"{request.method} {request.url} {response.status_code}, {dt} msec")
+    this_session["requests"] += 1
+    this_session["bytes"] += _record_metrics( request, response )
     return response
 
+def _new_session( session_id ):
+    if len(sessions) >= _MAX_SESSIONS:
+        # Drop the least recently used session. This is only
+        # done for new sessions, and the table is small.
+        now = ticks_ms()
+        del sessions[ max( sessions, key=lambda k: 
+                    ticks_diff( now, sessions[k]["last_activity"] ) ) ]
+    # If password_required, then login starts as False
+    # If not password_required, then login will be always True
+    # All fields are created here, updating them
+    # with each request does not allocate memory.
+    this_session = {"login":not config.password_required,
+                    "last_activity": 0, "ip": "",
+                    "requests": 0, "bytes": 0, 
+                    "push_events": 0, "push_bytes": 0 }
+    # Session information will be lost with each reboot, i.e.
+    # it is NOT kept in flash. This means a user is logged out
+    # on reboot.
+    sessions[session_id] = this_session
+    return this_session
+
+def _touch_session( this_session ):
+    global _last_activity
+    _last_activity = ticks_ms()
+    this_session["last_activity"] = _last_activity
+
+@app.after_error_request
+def func_after_error_req( request, response ):
+    # The route raised an exception, the error handler may
+    # have answered with status 200 and an alert for the browser
+    if request is not None and request.url_pattern is not None:
+        _record_metrics( request, response, error=True )
+    return response
+
+def _record_metrics( request, response, error=False ):
+    # Returns bytes of the response, if known
+    if isinstance( response.body, bytes ):
+        bytes_out = len(response.body)
+    else:
+        bytes_out = int( response.headers.get( "Content-Length", 0 ) )
+    try:
+        dt = ticks_diff( ticks_ms(), request.g.t0 )
+    except AttributeError:
+        # Exception before the handler started
+        dt = 0
+    metrics.add_request( request.url_pattern, dt, 
+                         500 if error else response.status_code,
+                         bytes_out, scheduler.is_player_active() )
+    _logger.debug(f"{request.method} {request.url} {response.status_code}, {dt} msec")
+    return bytes_out
+
 
 def is_active(since_msec=60_000):
     # Return true if recent web activity
-    now = ticks_ms()
-    return any( 
-            s for s in sessions.values()
-            if ticks_diff(now, s["last_activity"]) <= since_msec
-            )
+    return ( _last_activity is not None 
+             and ticks_diff( ticks_ms(), _last_activity ) <= since_msec )
 
 def respond_ok():
     # Absence of "error":True means "everything is ok"
@@ -114,9 +198,12 @@ def authorize(func):
             # args[0] is the request object
             this_session = get_session( args[0] )
         except KeyError:
-            this_session = {}
-        # No need to check config.password_required because
-        # that was checked when handing out the session cookie in after_request
+            # No session cookie, or the session was dropped because
+            # there were too many. Don't ask for a password that is
+            # not required.
+            this_session = {"login": not config.password_required}
+        # No need to check config.password_required for a known session
+        # because that was checked when handing out the session cookie in after_request
         if this_session.get("login"):
             # Is login: authorized to call the function
             return await func(*args, **kwargs)
@@ -174,35 +261,34 @@ async def static_files( request, path ):
             return "Safari not supported, use Chrome or Firefox"
     # No RequestSlice here, if someone wants to load pages while
     # playing music, let them.
-    for folder in STATIC_FOLDERS:
-        filename = folder + path
-        # Check first for uncompressed file. 
-        # Could make it easier for development since
-        # uploading a uncompressed file takes precedence.
-        if fileops.file_exists(filename):
-            return send_file(filename, max_age=MAX_AGE)
-        
-        # File not found, perhaps a compressed version exists?
-        # In that case, add a header for the Content-type  according to file type
-        # and a header for Content-Encoding = gzip
-        filename_zip = filename + ".gz"
-        if fileops.file_exists( filename_zip ):
-            # If .gz file, serve this compressed file 
-            # instead of regular file
-            # On Mac, compress with gzip, for example:
-            # gzip -9 -c -k config.html > config.html.gz
-            # See https://www.gzip.org/
-            # Content type depends on the original file type
-            ct = fileops.get_mime_type( filename )
-
-            return send_file(filename_zip, max_age=MAX_AGE, compressed=True, content_type=ct)
-    _logger.info(f"static_files {filename} not found")
-    return respond_not_found()
+    # staticindex knows which file to serve. The uncompressed file
+    # takes precedence over a compressed .gz file, this
+    # makes development easier.
+    # On Mac, compress with gzip, for example:
+    # gzip -9 -c -k config.html > config.html.gz
+    # See https://www.gzip.org/
+    asset = staticindex.lookup( path )
+    if not asset:
+        _logger.info(f"static_files {path} not found")
+        return respond_not_found()
+    filename, compressed, size, ct, etag = asset
+    if etag in request.headers.get("If-None-Match", ""):
+        # Browser has this file, no need to touch flash
+        return "", 304, { "ETag": etag, "Cache-Control": f"max-age={MAX_AGE}" }
+    response = send_file(filename, max_age=MAX_AGE, compressed=compressed,
+                         content_type=ct, stream=open(filename, "rb"))
+    response.headers["Content-Length"] = str(size)
+    response.headers["ETag"] = etag
+    return response
 
 
 @app.route("/data/<filepath>")
 async def send_data_file(request, filepath):
     filename = config.DATA_FOLDER + filepath
+    if not fileops.file_exists(filename):
+        # Check again, the path cache may be stale if the file was
+        # written without fileops.invalidate()
+        fileops.invalidate(filename)
     # Do not serve non-existent files nor temporary MIDI files
     if not fileops.file_exists(filename) or filename.lower().endswith(".mid"):
         _logger.info(f"send_data_file {filename} not found")
@@ -212,8 +298,19 @@ async def send_data_file(request, filepath):
         return respond_not_found()
     # Don't cache data files with the brower. 
     # Cacheing json files is controlled at the Javascript level.
-
-    return send_file(filename, max_age=0)
+    if filepath == "tunelib.json" and "gzip" in request.headers.get("Accept-Encoding", ""):
+        # Send the compressed copy, this is the largest json file
+        gz_filename = await tunemanager.get_tunelib_export()
+        if gz_filename:
+            response = send_file( gz_filename, max_age=0, compressed=True )
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+    try:
+        return send_file(filename, max_age=0)
+    except OSError:
+        # Deleted, but the path cache did not know
+        fileops.invalidate(filename)
+        return respond_not_found()
 
 def get_progress():
     # Gather progress from all sources
@@ -227,10 +324,106 @@ def get_progress():
     # commonGetProgress() in common.js filters for setlist and adds tunelib
     return progress
 
+# /get_progress and /progress_events serve the progress cached
+# by progresscache.py, it is gathered only when a source has changed.
+progresscache.set_builder( get_progress )
+# Limit for the long poll wait of /get_progress
+_MAX_WAIT_MSEC = const(30_000)
+
 @app.route("/get_progress")
 async def ws_get_progress(request):
-    # get_progress() itself is very fast (<10 msec)
-    return get_progress()
+    # The browser revalidates with If-None-Match, so if nothing
+    # changed the answer is a 304 without body. With ?wait=msec,
+    # a client can wait for the next change (long poll).
+    body, etag = progresscache.get_json()
+    if request.headers.get("If-None-Match") == etag:
+        try:
+            wait = min( int( request.args.get("wait", 0) ), _MAX_WAIT_MSEC )
+        except ValueError:
+            wait = 0
+        if wait <= 0 or not await progresscache.wait_change(
+                progresscache.version, wait ):
+            return "", 304, { "ETag": etag }
+        body, etag = progresscache.get_json()
+    return body, { "Content-Type": "application/json; charset=UTF-8",
+                   "Cache-Control": "no-cache",
+                   "ETag": etag }
+
+# Progress pushed to the browser with Server-Sent Events.
+# Instead of each open page polling /get_progress, each page
+# holds one /progress_events connection, and gets only the fields
+# that changed since its last event.
+# Minimum time between events to one client
+_MIN_EVENT_MSEC = const(500)
+# Send a comment line if nothing changed, to detect closed
+# connections and to keep the session active (see is_active())
+_HEARTBEAT_MSEC = const(15_000)
+
+class ProgressEvents:
+    # Response body for /progress_events. MicroPython has no
+    # async generators, microdot accepts any object with __anext__.
+    def __init__( self, session_id, interval ):
+        self.session_id = session_id
+        self.interval = max( interval, _MIN_EVENT_MSEC )
+        # Snapshot last sent to this client, first event sends all fields
+        self.sent = {}
+        self.version = -1
+        self.last_event = ticks_ms()
+        self.t0 = self.last_event
+        self.events = 0
+        self.bytes = 0
+        self.closed = False
+
+    def __aiter__( self ):
+        return self
+
+    async def __anext__( self ):
+        if self.closed:
+            raise StopAsyncIteration
+        if not await progresscache.wait_change( self.version, _HEARTBEAT_MSEC ):
+            # Nothing changed, keep the connection and session alive
+            self._count( 3 )
+            return b": \n\n"
+        # Rate limit this client. Changes in the meantime
+        # are merged into one event.
+        wait = self.interval - ticks_diff( ticks_ms(), self.last_event )
+        if wait > 0:
+            await asyncio.sleep_ms( wait )
+        snapshot = progresscache.get_snapshot()
+        self.version = progresscache.version
+        delta = ",".join( f'"{k}":{v}' for k,v in snapshot.items()
+                          if self.sent.get(k) != v )
+        self.sent = snapshot
+        self.last_event = ticks_ms()
+        event = f"data: {{{delta}}}\n\n".encode()
+        self._count( len(event) )
+        return event
+
+    def _count( self, n ):
+        self.events += 1
+        self.bytes += n
+        session = sessions.get( self.session_id )
+        if session is not None:
+            _touch_session( session )
+            session["push_events"] += 1
+            session["push_bytes"] += n
+
+    async def aclose( self ):
+        if self.closed:
+            return
+        self.closed = True
+        dt = max( ticks_diff( ticks_ms(), self.t0 ), 1 )
+        _logger.debug(f"progress_events closed {self.events} events {self.bytes} bytes {self.bytes*1000//dt} bytes/sec")
+
+@app.route("/progress_events")
+async def progress_events(request):
+    try:
+        interval = int( request.args.get("interval", _MIN_EVENT_MSEC) )
+    except ValueError:
+        interval = _MIN_EVENT_MSEC
+    return ProgressEvents( request.cookies.get("session"), interval ), {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache" }
 
 #
 # Setlist management
@@ -322,7 +515,14 @@ async def save_titles( request ):
 #
 @app.route("/get_organtuner_json")
 async def get_organtuner_json( request ):
-    return get_organtuner().get_organtuner_json();
+    # With ?since=version, only the pins changed after that version
+    since = request.args.get( "since" )
+    if since is not None:
+        try:
+            since = int( since )
+        except ValueError:
+            return respond_error_alert( "Bad tuning version" )
+    return get_organtuner().get_organtuner_json( since )
 
 @app.route("/note/<int:pin_index>")
 async def note_page(request, pin_index):
@@ -471,7 +671,9 @@ async def diag(request):
         "logfilename": _logger.get_current_log_filename(),
         "errors_since_reboot": _logger.get_error_count(),
         "compile_date": compiledate,
-        "crank_installed": crank.is_installed()
+        "crank_installed": crank.is_installed(),
+        "request_queue": admission.get_queue_info(),
+        "route_times": metrics.get_text()
     }
     try:
         from mcserver import mcserver # type:ignore
@@ -483,6 +685,28 @@ async def diag(request):
     return d
 
 
+@app.route("/metrics")
+async def get_metrics(request):
+    # Web server metrics per route, see metrics.py, and
+    # counters of the player to compare with.
+    # /metrics is text, /metrics?format=json is json.
+    actuator_stats = ActuatorStats.get()
+    player_info = {
+        "request_queue": admission.queue_depth,
+        "max_request_queue": admission.max_queue_depth,
+        "late_notes": actuator_stats.get( "late notes", 0 ),
+        "max_note_late": actuator_stats.get( "max note late", 0 ),
+        "max_gc_collect_time": scheduler.max_gc_time,
+        "player_active": scheduler.is_player_active()
+    }
+    if request.args.get( "format" ) == "json":
+        m = metrics.get_json()
+        m.update( player_info )
+        return m
+    return ( "\n".join( f"{k} {v}" for k, v in player_info.items() )
+             + "\n" + metrics.get_text() + "\n",
+             200, { "Content-Type": "text/plain; charset=utf-8" } )
+
 @app.route("/reset")
 async def reset_microcontroller(request):
     # Wait for web server to respond, wait for led to flash, etc
@@ -511,9 +735,13 @@ async def get_wifi_status(request):
         return round(ticks_diff( now, session["last_activity"] )/1000)
     c = wifimanager.get_status()
     # Add clientes with activities in the last minutes
+    # with requests and response bytes per client, pushed progress
+    # events are shown as +events/bytes
     c["client_IPs"] = "".join(
         (
             f'{s["ip"]}={seconds_since_last(s)}sec '
+            f'{s["requests"]}req/{s["bytes"]}B'
+            f'+{s["push_events"]}ev/{s["push_bytes"]}B '
             for s in sessions.values()
         )
     )
@@ -575,6 +803,8 @@ async def get_stored_config(request):
 @authorize
 async def change_config(request):
     config.save(request.json)
+    # automatic_delay is part of progress
+    progresscache.mark_dirty()
     return respond_ok()
 
 #
@@ -708,10 +938,9 @@ async def test_touchpad( request ):
 
 # Generic requests requests: some browsers request favicon
 def serve_favicon( fn ):
-    for folder in STATIC_FOLDERS:
-        filename = folder + fn
-        if fileops.file_exists( filename ):
-            return send_file(filename, max_age=MAX_AGE)
+    asset = staticindex.lookup( fn )
+    if asset:
+        return send_file(asset[0], max_age=MAX_AGE)
     return respond_not_found() # ???
 
 @app.route("/favicon.ico")
@@ -750,6 +979,52 @@ async def save_tunelib(request):
     return respond_ok()
 
 
+@app.route("/tunelib_query")
+async def tunelib_query(request):
+    # Paged and filtered tunelib, for example
+    # /tunelib_query?genre=Tango&search=cumparsita&sort=title&start=0&count=50
+    # Filters: genre, author, rating, autoplay (1 or 0)
+    # Optional: columns=id,title,... desc=1
+    # Answers {"total": tunes found, "columns": [...], "rows": [[...],...],
+    #   "signature": tunelib signature}
+    args = request.args
+    try:
+        total, columns, rows = tunemanager.query(
+            { k: args[k] for k in ( "genre", "author", "rating", "autoplay" ) if k in args },
+            search=args.get( "search", "" ),
+            sort=args.get( "sort", "title" ),
+            reverse=args.get( "desc" ) == "1",
+            start=int( args.get( "start", 0 ) ),
+            count=int( args.get( "count", 50 ) ),
+            columns=args.get( "columns" ) )
+    except (KeyError, ValueError):
+        return respond_error_alert( "Bad tunelib query" )
+    return { "total": total, "columns": columns, "rows": rows,
+             "signature": tunemanager.tunelib_signature }
+
+@app.route("/tunelib_changes")
+async def tunelib_changes(request):
+    # Changes of the tunelib since a version, the version is
+    # the tunelib_signature of the progress, for example
+    # /tunelib_changes?since=12
+    # Answers {"version": current version, "full": false,
+    #   "changes": {tuneid: tune, tuneid: {column: value}, tuneid: null}}
+    # or {"version": current version, "full": true} if
+    # tunelib.json must be read again.
+    try:
+        since = int( request.args.get( "since", 0 ) )
+    except ValueError:
+        return respond_error_alert( "Bad tunelib version" )
+    return tunemanager.get_changes( since )
+
+@app.route("/lyrics/<tuneid>")
+async def get_lyrics( request, tuneid ):
+    # Lyrics of one tune, {"lyrics": text}, the text is "" if none
+    try:
+        return { "lyrics": tunemanager.get_lyrics( tuneid ) }
+    except ValueError:
+        return respond_not_found()
+
 @app.post("/save_lyrics")
 async def save_lyrics( request ): 
     data = request.json
@@ -847,8 +1122,21 @@ async def filemanager_listdir(request, path=""):
     if listpath.endswith("filemanager.html"):
         # Don't navigate to /static/filemanager.html please.
         return respond_error_alert("Use /filemanager")
+    # Optional paging and sorting, for example
+    # /listdir/tunelib?sort=date&desc=1&start=0&count=100
+    # The total number of entries is in the X-Total-Count header.
+    args = request.args
+    count = args.get( "count" )
     import filemanager
-    return filemanager.listdir( listpath )
+    try:
+        total, listing = filemanager.listdir( listpath,
+            sort=args.get( "sort", "name" ),
+            reverse=args.get( "desc" ) == "1",
+            start=int( args.get( "start", 0 ) ),
+            count=int( count ) if count else None )
+    except (KeyError, ValueError):
+        return respond_error_alert( "Bad listdir parameters" )
+    return listing, 200, { "X-Total-Count": str(total) }
 
 # >>> ?? not used
 #@app.route("/listdir_tunelib")
@@ -865,17 +1153,34 @@ async def filemanager_upload(request, path_filename ):
     _logger.info(f"Uploading {filename} to {path}")
     import filemanager
     try:
-        return filemanager.upload( request.body, path, filename, int(mtime), int(size)  )
+        return await filemanager.upload( request.stream, request.content_length,
+                                         path, filename, int(mtime), int(size)  )
     except Exception as e:
         print(f"Error in /upload: {repr(e)}")
         return respond_error_alert(f"Error uploading {repr(e)}")
     
+@app.post("/upload_batch/<path>")
+@authorize
+async def filemanager_upload_batch(request, path ):
+    # Upload several files in one request, see upload_batch()
+    # in filemanager.html
+    path = decodePath( path )
+    import filemanager
+    t0 = ticks_ms()
+    try:
+        results = await filemanager.upload_batch( request.stream, request.content_length, path )
+    except Exception as e:
+        _logger.exc( e, "Error in /upload_batch" )
+        return respond_error_alert(f"Error uploading {repr(e)}")
+    _logger.info(f"Batch upload of {len(results)} files, {request.content_length} bytes to {path} in {ticks_diff(ticks_ms(), t0)} msec")
+    return results
+
 @app.route("/download/<path>")
 @authorize
 async def filemanager_download(request, path):
     # Download a file from the microcontroller to the PC
     import filemanager
-    return filemanager.download( decodePath( path ) )
+    return filemanager.download( decodePath( path ), request )
 
 # >>> show_file of log asks for password...??
 #    "json", "json-yyyy-mm-dd": ok (check again???>>>)
@@ -934,19 +1239,33 @@ async def filemanager_delete(request):
 #     filemanager.purge_tunelib_file(  filename )
 #     return respond_ok()
 
-@app.post("/make_tarball")
+@app.post("/prepare_tarball")
 @authorize
-async def make_tarball(request):
+async def prepare_tarball(request):
+    # Returns the url to download the tarball, see filemanager.py
     import filemanager
-    filelist = request.json
-    # Archive is the last in the filelist, the rest are files to be archived
-    tar_fn = filelist.pop()
-    filemanager.make_tarball( tar_fn, filelist )
-    return respond_ok()
+    data = request.json
+    return filemanager.prepare_tarball( data["files"], data["name"], data.get("gzip", False) )
+
+@app.route("/can_compress")
+async def can_compress(request):
+    # filemanager.html hides the gzip option if not available
+    return {"can_compress": fileops.can_compress()}
+
+@app.route("/download_tarball/<token>")
+@authorize
+async def download_tarball(request, token):
+    # The token was issued by /prepare_tarball.
+    # The tarball is generated while sending it, nothing is written to flash.
+    import filemanager
+    try:
+        return filemanager.download_tarball( token )
+    except ValueError:
+        return respond_not_found()
 
 # Test: tarball with 608 files, 3_021_365 bytes net, 4_292_608 bytes on flash
-# took 133.8 sec (2 minutes and 14 seconds) 
-# and output file was 3_491_840 bytes on flash.
+# took 133.8 sec (2 minutes and 14 seconds) when the tarball was
+# written to flash, output file was 3_491_840 bytes on flash.
 
 @app.route("/filemanager")
 @app.route("/filemanager/")
@@ -1006,6 +1325,8 @@ async def run_webserver():
     # Configure file cache for browser
     # MAX_AGE is applied selectively
     _logger.debug(f"{MAX_AGE=:,} sec {STATIC_FOLDERS=}")
+    # Build the index of static files now, not with the first request
+    staticindex.lookup( "index.html" )
     await app.start_server(host="0.0.0.0", port=80 )
 
 
@@ -404,7 +404,54 @@ class GetProgress{
 		return this.sleep_ms;
 	}
 	startBackground(){
-		this.#backgroundProcess();
+		// Progress is pushed by the server with Server-Sent Events,
+		// polling is the fallback.
+		if( window.EventSource && !isUsedFromServer() ){
+			this.#openEventSource();
+			document.addEventListener("visibilitychange", () => {
+				// Do not refresh hidden/background pages.
+				if( document.hidden ){
+					this.#closeEventSource();
+				}
+				else{
+					this.#openEventSource();
+				}
+			});
+		}
+		else{
+			this.#backgroundProcess();
+		}
+	}
+	#openEventSource(){
+		if( this.eventSource ){
+			return;
+		}
+		// The server sends at most one event every this.sleep_ms
+		this.eventSource = new EventSource( "/progress_events?interval=" + this.sleep_ms );
+		this.eventSource.onopen = () => {
+			// First event of a connection has all fields
+			this.pushedProgress = {};
+		};
+		this.eventSource.onmessage = async (event) => {
+			// Events have only the fields that changed
+			Object.assign( this.pushedProgress, JSON.parse( event.data ) );
+			// #filterProgress modifies progress, work on a copy
+			let progress = Object.assign( {}, this.pushedProgress );
+			try{
+				await this.#filterProgress( progress );
+				await this.#checkCaches( progress );
+			}
+			catch(e){
+				console.error("GetProgress event failed", e);
+			}
+		};
+		// On error, EventSource reconnects by itself.
+	}
+	#closeEventSource(){
+		if( this.eventSource ){
+			this.eventSource.close();
+			this.eventSource = undefined;
+		}
 	}
 	async getProgress( ){
 		let progress = await this.fetchProgress( "/get_progress");
@@ -457,6 +504,44 @@ class GetProgress{
 			await sleep_ms(this.sleep_ms);
 		}
 	}
+	async #applyTunelibChanges( since ){
+		// Apply the changes of the tunelib after version "since" (the tunelib
+		// signature) to the cached tunelib.json. Returns false if the
+		// caches must be dropped and tunelib.json read again.
+		if( isUsedFromServer() || tunelibCache.theData == null ){
+			return false;
+		}
+		try{
+			let result = await fetch_json( "/tunelib_changes?since=" + since );
+			if( result["full"] ){
+				return false;
+			}
+			let tunelib = tunelibCache.theData;
+			for( let [tuneid, change] of Object.entries( result["changes"] ) ){
+				if( change == null ){
+					delete tunelib[tuneid];
+				}
+				else if( Array.isArray( change ) ){
+					tunelib[tuneid] = change;
+				}
+				else if( tuneid in tunelib ){
+					// Only some columns changed, keys are the column numbers
+					Object.assign( tunelib[tuneid], change );
+				}
+				else{
+					return false;
+				}
+			}
+			tunelibCache.store();
+			// Lyrics may have changed too
+			lyricsCache.drop();
+			return true;
+		}
+		catch(e){
+			console.error("applyTunelibChanges failed", e);
+			return false;
+		}
+	}
 	async #checkCaches(progress){
 		// Check if caches have to be dropped or page reloaded
 		// to reload caches with fresh information.
@@ -475,7 +560,8 @@ class GetProgress{
 		let tunelib_change = progress.tunelib_signature != this.stored_tunelib_signature ;
 		let reboot = progress.boot_session != this.stored_boot_session;
 		// console.log(">>>#checkCaches reboot=", reboot, "tunelib_change=", tunelib_change);
-		if( tunelib_change || reboot ){
+		// If the tunelib changed, try to update the cached tunelib with the changes only.
+		if( reboot || (tunelib_change && !(await this.#applyTunelibChanges( this.stored_tunelib_signature )))){
 			// Force refresh of all the (registered) JsonCache objects
 			// by calling their drop method
 			this.dropCaches();
@@ -875,6 +961,10 @@ class JsonCache{
 		this.theData = JSON.parse( data ) ;
 		return this.theData;
 	}
+	store(){
+		// Store theData after changing it
+		sessionStorage.setItem( this.url, JSON.stringify( this.theData ) );
+	}
 	drop(){
 		// console.log(">>>cache drop", this.url );
 		sessionStorage.removeItem( this.url  );
@@ -883,10 +973,31 @@ class JsonCache{
 
 }
 let tunelibCache = new JsonCache( "/data/tunelib.json");
-let lyricsCache = new JsonCache( "/data/lyrics.json");
+class LyricsCache{
+	// Lyrics are fetched one tune at a time when needed, and kept
+	// in this page until dropped.
+	constructor(){
+		this.lyrics = {};
+		commonGetProgress.registerCache( this );
+	}
+	async get( tuneid ){
+		if( !tuneid ){
+			// No tune, or called by fillCaches(): nothing to fill in advance
+			return;
+		}
+		if( !(tuneid in this.lyrics) ){
+			this.lyrics[tuneid] = (await fetch_json( "/lyrics/" + tuneid ))["lyrics"];
+		}
+		return this.lyrics[tuneid];
+	}
+	drop(){
+		this.lyrics = {};
+	}
+}
+let lyricsCache = new LyricsCache();
 async function lyricsCacheTuneid( tuneid ){
 	// If no lyrics available, return empty string
-	return ((await lyricsCache.get())[tuneid]) || "";
+	return (await lyricsCache.get( tuneid )) || "";
 }
 let configCache = new JsonCache( "/get_current_config");
 
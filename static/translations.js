@@ -360,6 +360,10 @@ let translationDict = {
 	["Logout", "Logout"],
 "máximo tiempo para gc": // diag.html
 	["Maximum gc time","Höchste gc Zeit"],
+"cola de solicitudes": // diag.html
+	["Request queue","Anfragewarteschlange"],
+"tiempos por ruta": // diag.html
+	["Time per route","Zeit pro Route"],
 "melodía actual":  // server index.html
 	["Current tune", "Gegenwärtige Melodie"],
 }
@@ -0,0 +1,70 @@
+# Load generator to measure the web server of the microcontroller.
+# Run on the PC, for example:
+#   python3 loadtest.py 192.168.4.1 /get_progress --clients 3 --seconds 20
+# Reports requests/sec and latency percentiles, with one HTTP/1.1
+# connection kept alive per client, or with a new connection
+# for each request with --close.
+import argparse
+import http.client
+import threading
+import time
+
+def client( host, path, seconds, close, latencies, errors ):
+    conn = None
+    t_end = time.monotonic() + seconds
+    while time.monotonic() < t_end:
+        t0 = time.monotonic()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection( host, timeout=10 )
+            headers = {"Connection": "close"} if close else {}
+            conn.request( "GET", path, headers=headers )
+            response = conn.getresponse()
+            response.read()
+            if close or response.getheader("Connection", "").lower() == "close":
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors.append( 1 )
+            if conn:
+                conn.close()
+            conn = None
+            continue
+        latencies.append( time.monotonic() - t0 )
+    if conn:
+        conn.close()
+
+def percentile( sorted_values, p ):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values)-1, int(len(sorted_values)*p/100))]
+
+def main():
+    parser = argparse.ArgumentParser( description="Web server load test" )
+    parser.add_argument( "host" )
+    parser.add_argument( "path", nargs="?", default="/get_progress" )
+    parser.add_argument( "--clients", type=int, default=1 )
+    parser.add_argument( "--seconds", type=int, default=10 )
+    parser.add_argument( "--close", action="store_true", help="new connection for each request" )
+    args = parser.parse_args()
+
+    latencies = []
+    errors = []
+    threads = [ threading.Thread( target=client,
+                    args=(args.host, args.path, args.seconds, args.close, latencies, errors) )
+                for _ in range(args.clients) ]
+    t0 = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    dt = time.monotonic() - t0
+
+    latencies.sort()
+    print(f"{args.path} clients={args.clients} keep-alive={not args.close}")
+    print(f"requests={len(latencies)} errors={len(errors)} requests/sec={len(latencies)/dt:.1f}")
+    for p in (50, 95, 99):
+        print(f"p{p}={percentile(latencies, p)*1000:.0f} msec")
+
+if __name__ == "__main__":
+    main()